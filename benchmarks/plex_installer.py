@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the install hot path of the ``plex`` module, using a local stand-in for plex.tv.
+
+A local HTTP server serves a synthetic ``downloads/5.json`` feed and generated release tarballs (with support for HEAD,
+Range, and conditional requests), so download, hashing, and extraction changes can be compared without network access
+or a real Plex token.
+
+Example::
+
+    python benchmarks/plex_installer.py --size 200 --files 500 --repeat 3 --streaming
+
+:author: Doug Skrypa
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tarfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from statistics import mean
+from tempfile import TemporaryDirectory
+from threading import Thread
+from typing import Callable, List, Optional, Tuple
+
+sys.path.insert(0, Path(__file__).resolve().parents[1].joinpath('plugins', 'modules').as_posix())
+
+from plex import PlexInstaller  # noqa: E402
+
+SYSTEM, BUILD, DISTRO = 'freebsd', 'freebsd-x86_64', 'freebsd'
+FEED_PATH = '/api/downloads/5.json'
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark PlexInstaller against a local fake plex.tv')
+    parser.add_argument('--size', '-s', type=int, default=100, help='Total uncompressed release size in MB')
+    parser.add_argument('--files', '-f', type=int, default=200, help='Number of files in the release')
+    parser.add_argument('--compression', '-c', choices=('bz2', 'gz', 'xz'), default='bz2', help='Release compression')
+    parser.add_argument('--changed', type=float, default=0.1, help='Fraction of files that change between versions')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Number of times to run each benchmark')
+    parser.add_argument('--connections', type=int, default=4, help='Parallel connections for ranged downloads')
+    parser.add_argument('--streaming', action='store_true', help='Use streaming_install')
+    parser.add_argument('--delta', action='store_true', help='Use delta_install')
+    parser.add_argument('--extract-backend', choices=('auto', 'python'), default='auto', help='Extraction backend')
+    parser.add_argument('--work-dir', help='Directory to use for generated files (default: a temporary directory)')
+    args = parser.parse_args()
+
+    with TemporaryDirectory(dir=args.work_dir) as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        print(f'Generating {args.files} files / {args.size} MB releases in {tmp_dir}...')
+        releases = generate_releases(tmp_dir.joinpath('src'), args.size, args.files, args.compression, args.changed)
+        release_size = releases[-1].stat().st_size
+        with FakePlexServer(releases) as server:
+            bench = InstallerBenchmark(
+                server,
+                tmp_dir.joinpath('run'),
+                download_connections=args.connections,
+                streaming_install=args.streaming,
+                delta_install=args.delta,
+                extract_backend=args.extract_backend,
+            )
+            results = bench.run_all(args.repeat)
+
+    print_results(results, release_size)
+
+
+# region Release Generation
+
+
+def generate_releases(
+    src_dir: Path, size_mb: int, file_count: int, compression: str, changed: float
+) -> Tuple[Path, Path]:
+    """Generate two release tarballs, where the second one has ``changed`` of the first one's files modified."""
+    file_size = max(size_mb * 1_000_000 // max(file_count, 1), 1)
+    tree_dir = src_dir.joinpath('plexmediaserver')
+    tree_dir.joinpath('lib').mkdir(parents=True)
+    for i in range(file_count):
+        # Half random, half zeros, so the archive is somewhat compressible, like real binaries
+        data = os.urandom(file_size // 2) + bytes(file_size - file_size // 2)
+        tree_dir.joinpath('lib', f'file_{i:05d}.so').write_bytes(data)
+    tree_dir.joinpath('Plex Media Server').write_bytes(os.urandom(1024))
+
+    name_fmt = 'PlexMediaServer-{}-FreeBSD-amd64.tar.' + compression
+    old_path = _make_tarball(tree_dir, src_dir.joinpath(name_fmt.format('1.0.0.1-aaaa')))
+    for i in range(int(file_count * changed)):
+        path = tree_dir.joinpath('lib', f'file_{i:05d}.so')
+        path.write_bytes(os.urandom(16) + path.read_bytes()[16:])
+    new_path = _make_tarball(tree_dir, src_dir.joinpath(name_fmt.format('1.0.0.2-bbbb')))
+    shutil.rmtree(tree_dir)
+    return old_path, new_path
+
+
+def _make_tarball(tree_dir: Path, path: Path) -> Path:
+    compression = path.suffix[1:]
+    kwargs = {} if compression == 'xz' else {'compresslevel': 1}
+    with tarfile.open(path, f'w:{compression}', **kwargs) as tar_file:
+        tar_file.add(tree_dir, arcname=tree_dir.name)
+    return path
+
+
+# endregion
+
+
+# region Fake plex.tv
+
+
+class FakePlexServer:
+    """Serves a downloads feed with the given releases (the last one is the latest version), and the releases."""
+
+    def __init__(self, releases: Tuple[Path, ...]):
+        self.releases = {f'/releases/{path.name}': path for path in releases}
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), partial(_Handler, self))
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.feed = self._build_feed(releases)
+        self._thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    def _build_feed(self, releases: Tuple[Path, ...]) -> bytes:
+        path = releases[-1]
+        version = self.release_version(path)
+        release = {
+            'build': BUILD,
+            'distro': DISTRO,
+            'url': f'{self.base_url}/releases/{path.name}',
+            'checksum': hashlib.sha1(path.read_bytes()).hexdigest(),
+        }
+        return json.dumps({'computer': {'FreeBSD': {'version': version, 'releases': [release]}}}).encode('utf-8')
+
+    def release_version(self, path: Path) -> str:
+        return re.match(r'PlexMediaServer-(.+?)-FreeBSD', path.name).group(1)
+
+    def __enter__(self) -> 'FakePlexServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _Handler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+
+    def __init__(self, fake: FakePlexServer, *args, **kwargs):
+        self.fake = fake
+        self._remaining = 0
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, *args):
+        pass
+
+    def send_head(self):
+        path = self.path.split('?', 1)[0]
+        if path == FEED_PATH:
+            return self._send_feed()
+        try:
+            release_path = self.fake.releases[path]
+        except KeyError:
+            self.send_error(404)
+            return None
+        return self._send_file(release_path)
+
+    def _send_feed(self):
+        etag = '"{}"'.format(hashlib.sha1(self.fake.feed).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(self.fake.feed)))
+        self.end_headers()
+        return _BytesReader(self.fake.feed)
+
+    def _send_file(self, path: Path):
+        size = path.stat().st_size
+        f = path.open('rb')
+        if range_header := self.headers.get('Range'):
+            start, end = re.match(r'bytes=(\d+)-(\d*)', range_header).groups()
+            start, end = int(start), int(end) if end else size - 1
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            f.seek(start)
+            self._remaining = end - start + 1
+        else:
+            self.send_response(200)
+            self._remaining = size
+
+        self.send_header('Content-Length', str(self._remaining))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', f'"{int(path.stat().st_mtime)}-{size}"')
+        self.end_headers()
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = self._remaining if not isinstance(source, _BytesReader) else len(source.data)
+        while remaining:
+            chunk = source.read(min(65536, remaining))
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+
+class _BytesReader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self._pos = 0
+
+    def read(self, size: int) -> bytes:
+        chunk = self.data[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+    def close(self):
+        pass
+
+
+# endregion
+
+
+# region Benchmarks
+
+
+class Result:
+    def __init__(self, name: str):
+        self.name = name
+        self.times: List[float] = []
+        self.peak_mem: int = 0
+        self.bytes: Optional[int] = None
+
+
+class InstallerBenchmark:
+    def __init__(self, server: FakePlexServer, run_dir: Path, **installer_kwargs):
+        self.server = server
+        self.run_dir = run_dir
+        self.installer_kwargs = installer_kwargs
+        self._run_num = 0
+
+    def new_installer(self, cache_dir: Path = None, install_dir: Path = None) -> PlexInstaller:
+        self._run_num += 1
+        base_dir = self.run_dir.joinpath(f'run_{self._run_num}')
+        installer = PlexInstaller(
+            'fake-token',
+            install_dir=install_dir or base_dir.joinpath('install', 'plex_media_server'),
+            system=SYSTEM,
+            build=BUILD,
+            distro=DISTRO,
+            cache_dir=cache_dir or base_dir.joinpath('cache'),
+            **self.installer_kwargs,
+        )
+        installer.feed_url = self.server.base_url + FEED_PATH
+        return installer
+
+    def run_all(self, repeat: int) -> List[Result]:
+        results = []
+        latest_size = list(self.server.releases.values())[-1].stat().st_size
+        for name, setup, func in self._benchmarks():
+            print(f'Running {name}...')
+            result = Result(name)
+            for _ in range(repeat):
+                result.times.append(_time(partial(func, *setup())))
+            # Memory is measured in a separate run, since tracing allocations slows down Python code significantly
+            result.peak_mem = _peak_memory(partial(func, *setup()))
+            if name in ('download_release', 'install'):
+                result.bytes = latest_size
+            results.append(result)
+            shutil.rmtree(self.run_dir, ignore_errors=True)
+        return results
+
+    def _benchmarks(self):
+        def new():
+            return (self.new_installer(),)
+
+        def installed_previous():
+            # Install the previous version directly from its file, so the benchmark only covers updating to the latest
+            installer = self.new_installer()
+            old_release = next(iter(self.server.releases.values()))
+            installer.__dict__['target_version'] = self.server.release_version(old_release)
+            installer.activate(installer._extract_release(old_release))
+            del installer.__dict__['target_version']
+            return (installer,)
+
+        def two_versions():
+            installer = self.new_installer()
+            version_dirs = []
+            for release_path in self.server.releases.values():
+                installer.__dict__['target_version'] = self.server.release_version(release_path)
+                version_dirs.append(installer._extract_release(release_path))
+            installer._replace_install_dir(version_dirs[0], installer.install_dir)
+            return installer, version_dirs[1]
+
+        yield 'full_downloads_info', new, lambda installer: installer.full_downloads_info
+        yield 'download_release', new, lambda installer: installer.download_release()
+        yield 'install', installed_previous, lambda installer: installer.install()
+        yield '_replace_install_dir', two_versions, lambda inst, version_dir: inst._replace_install_dir(
+            version_dir, inst.install_dir
+        )
+
+
+def _time(func: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def _peak_memory(func: Callable[[], None]) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def print_results(results: List[Result], release_size: int):
+    print(f'\nRelease archive size: {release_size / 1_000_000:,.1f} MB\n')
+    header = f'{"benchmark":<22}  {"mean (s)":>9}  {"min (s)":>9}  {"MB/s":>9}  {"peak py mem (MiB)":>17}'
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        mb_per_sec = f'{result.bytes / min(result.times) / 1_000_000:,.1f}' if result.bytes else '-'
+        peak = result.peak_mem / 1024 / 1024
+        print(
+            f'{result.name:<22}  {mean(result.times):>9.3f}  {min(result.times):>9.3f}  {mb_per_sec:>9}  {peak:>17.1f}'
+        )
+
+
+# endregion
+
+
+if __name__ == '__main__':
+    main()
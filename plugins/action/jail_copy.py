@@ -0,0 +1,109 @@
+"""
+Ansible action plugin for the ``jail_copy`` module, which copies files or directory trees into FreeBSD jails.
+
+When using the ``sshjail`` connection, the checksums, modes, and owners of all destination files are retrieved in one
+round trip, and all new or changed files are then transferred in one more round trip as a single tar stream, instead
+of transferring each file separately.  With any other connection, the task is handled by the ``copy`` action.
+
+:author: Doug Skrypa
+"""
+
+import hashlib
+import os
+
+from ansible.errors import AnsibleActionFail
+from ansible.plugins.action import ActionBase
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False  # put_files writes directly under the jail root, so no remote temp dir is needed
+    _VALID_ARGS = frozenset(('src', 'dest', 'mode', 'owner', 'group'))
+
+    def run(self, tmp=None, task_vars=None):
+        if not hasattr(self._connection, 'put_files'):
+            return self._run_copy(task_vars)
+
+        result = super().run(tmp, task_vars)
+        del tmp  # tmp no longer has any effect
+
+        args = self._task.args
+        try:
+            src, dest = args['src'], args['dest']
+        except KeyError as e:
+            raise AnsibleActionFail(f'Missing required argument: {e}') from None
+
+        mode = _parse_mode(args.get('mode'))
+        owner, group = args.get('owner'), args.get('group')
+        files = _find_files(self._find_needle('files', src), src, dest)
+        if not files:
+            raise AnsibleActionFail(f'No files were found in src={src}')
+
+        remote_info = self._connection.stat_files([dest_path for _, dest_path in files])
+        changed = []
+        for src_path, dest_path in files:
+            file_mode = mode if mode is not None else os.stat(src_path).st_mode & 0o7777
+            if _needs_update(src_path, remote_info[dest_path], file_mode, owner, group):
+                changed.append((src_path, dest_path, file_mode))
+
+        if changed and not self._play_context.check_mode:
+            self._connection.put_files(changed, owner, group)
+
+        result.update(changed=bool(changed), dest=dest, files=[dest_path for _, dest_path, _ in changed])
+        return result
+
+    def _run_copy(self, task_vars):
+        copy_action = self._shared_loader_obj.action_loader.get(
+            'ansible.legacy.copy',
+            task=self._task,
+            connection=self._connection,
+            play_context=self._play_context,
+            loader=self._loader,
+            templar=self._templar,
+            shared_loader_obj=self._shared_loader_obj,
+        )
+        return copy_action.run(task_vars=task_vars)
+
+
+def _parse_mode(mode):
+    if mode is None or isinstance(mode, int):
+        return mode
+    try:
+        return int(mode, 8)
+    except ValueError:
+        raise AnsibleActionFail(f'Invalid mode={mode!r} - only octal modes are supported') from None
+
+
+def _find_files(src_path: str, src: str, dest: str):
+    """
+    Follows the same conventions as ``copy``: if ``src`` is a directory, then its contents are copied into ``dest`` if
+    ``src`` ends with a slash, otherwise the directory itself is copied into ``dest``.  If ``src`` is a file and
+    ``dest`` ends with a slash, then the file is copied into ``dest``.
+    """
+    if not os.path.isdir(src_path):
+        if dest.endswith('/'):
+            dest = os.path.join(dest, os.path.basename(src_path))
+        return [(src_path, dest)]
+
+    if not src.endswith('/'):
+        dest = os.path.join(dest, os.path.basename(src_path.rstrip('/')))
+
+    files = []
+    for root, dirs, names in os.walk(src_path):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            files.append((path, os.path.join(dest, os.path.relpath(path, src_path))))
+    return files
+
+
+def _needs_update(src_path: str, remote_info, mode: int, owner: str, group: str) -> bool:
+    if remote_info is None:
+        return True
+
+    checksum, remote_mode, remote_owner, remote_group = remote_info
+    with open(src_path, 'rb') as f:
+        if hashlib.sha1(f.read()).hexdigest() != checksum:
+            return True
+    if int(remote_mode, 8) != mode:
+        return True
+    return (owner is not None and owner != remote_owner) or (group is not None and group != remote_group)
@@ -0,0 +1,91 @@
+"""
+Ansible action plugin for the ``jail_fetch`` module, which fetches files from FreeBSD jails.
+
+When using the ``sshjail`` connection, the checksums of all source files are retrieved in one round trip, and all new
+or changed files are then transferred in one more round trip as a single tar stream, instead of fetching each file
+separately.  With any other connection, each file is handled by the ``fetch`` action.
+
+:author: Doug Skrypa
+"""
+
+import hashlib
+import os
+
+from ansible.errors import AnsibleActionFail
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.plugins.action import ActionBase
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False  # fetch_files reads directly from under the jail root, so no remote temp dir is needed
+    _VALID_ARGS = frozenset(('src', 'dest', 'flat'))
+
+    def run(self, tmp=None, task_vars=None):
+        args = self._task.args
+        try:
+            srcs, dest = args['src'], args['dest']
+        except KeyError as e:
+            raise AnsibleActionFail(f'Missing required argument: {e}') from None
+
+        srcs = [srcs] if isinstance(srcs, str) else list(srcs)
+        flat = boolean(args.get('flat', False), strict=False)
+        if not hasattr(self._connection, 'fetch_files'):
+            return self._run_fetch(srcs, dest, flat, task_vars)
+
+        result = super().run(tmp, task_vars)
+        del tmp  # tmp no longer has any effect
+
+        dest = self._loader.path_dwim(os.path.expanduser(dest)) + ('/' if dest.endswith('/') else '')
+        files = _local_paths(srcs, dest, flat, task_vars['inventory_hostname'])
+        remote_info = self._connection.stat_files(srcs)
+        if missing := [src for src in srcs if remote_info[src] is None]:
+            raise AnsibleActionFail(f'Unable to find file(s) in the jail: {", ".join(missing)}')
+
+        changed = [(src, local_path) for src, local_path in files if _sha1(local_path) != remote_info[src][0]]
+        if changed and not self._play_context.check_mode:
+            self._connection.fetch_files(changed)
+
+        result.update(changed=bool(changed), dest=dest, files=[local_path for _, local_path in changed])
+        return result
+
+    def _run_fetch(self, srcs, dest, flat, task_vars):
+        result = {'changed': False, 'files': []}
+        for src in srcs:
+            task = self._task.copy()
+            task.args = {'src': src, 'dest': dest, 'flat': flat}
+            fetch_action = self._shared_loader_obj.action_loader.get(
+                'ansible.legacy.fetch',
+                task=task,
+                connection=self._connection,
+                play_context=self._play_context,
+                loader=self._loader,
+                templar=self._templar,
+                shared_loader_obj=self._shared_loader_obj,
+            )
+            res = fetch_action.run(task_vars=task_vars)
+            if res.get('failed'):
+                return res
+            elif res.get('changed'):
+                result['changed'] = True
+                result['files'].append(res['dest'])
+        return result
+
+
+def _local_paths(srcs, dest: str, flat: bool, hostname: str):
+    """Follows the same conventions as ``fetch`` for the local path of each file"""
+    if flat:
+        if not dest.endswith('/'):
+            if len(srcs) != 1:
+                raise AnsibleActionFail('dest must be a directory ending with / when fetching multiple files with flat')
+            return [(srcs[0], dest)]
+        return [(src, os.path.join(dest, os.path.basename(src))) for src in srcs]
+
+    return [(src, os.path.join(dest, hostname, os.path.normpath(src).lstrip('/'))) for src in srcs]
+
+
+def _sha1(path: str):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,218 @@
+"""
+Ansible action plugin for the ``plex`` module.
+
+Before running the module on a host, the target release is resolved on that host.  If it needs to be installed and is
+not already in the host's release cache, then it is downloaded once on the controller (shared by all hosts that need the
+same file via a lock in the controller cache directory), and transferred to the host's remote temp directory.  The
+module then moves it into the host's release cache while holding the same lock that it uses for downloads, where it
+will find it instead of downloading it from plex.tv again.
+
+:author: Doug Skrypa
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from ansible.errors import AnsibleError
+from ansible.module_utils.urls import open_url
+from ansible.plugins.action import ActionBase
+
+DEFAULT_CONTROLLER_CACHE_DIR = '~/.cache/ansible_plex/releases/'
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False  # A remote temp dir is only created by _push_release, when a release is pushed
+
+    def run(self, tmp=None, task_vars=None):
+        result = super().run(tmp, task_vars)
+        del tmp  # tmp no longer has any effect
+
+        module_args = self._task.args.copy()
+        cache_dir = Path(module_args.pop('controller_cache_dir', None) or DEFAULT_CONTROLLER_CACHE_DIR).expanduser()
+        try:
+            if module_args.get('state', 'present') in ('present', 'staged') and not self._play_context.check_mode:
+                resolved = self._execute_module(
+                    module_name=self._task.action, module_args={**module_args, 'state': 'resolved'}, task_vars=task_vars
+                )
+                if resolved.get('failed'):
+                    result.update(resolved)
+                    return result
+
+                release = resolved['release']
+                if resolved['needs_install'] and release['url'] and not release['cached']:
+                    cache = ControllerCache(
+                        cache_dir, _int_or_none(module_args.get('cache_max_bytes')),
+                        _int_or_none(module_args.get('cache_keep_versions')),
+                    )
+                    with cache.release(release['url'], release['checksum']) as local_path:
+                        module_args['release_src'] = self._push_release(local_path)
+
+            result.update(
+                self._execute_module(module_name=self._task.action, module_args=module_args, task_vars=task_vars)
+            )
+        finally:
+            self._remove_tmp_path(self._connection._shell.tmpdir)
+
+        return result
+
+    def _push_release(self, local_path: Path) -> str:
+        """Transfer the release to the remote temp dir, from which the module moves it into the release cache"""
+        tmp_dir = self._connection._shell.tmpdir or self._make_tmp_path()
+        tmp_path = self._connection._shell.join_path(tmp_dir, local_path.name)
+        self._transfer_file(local_path.as_posix(), tmp_path)
+        self._fixup_perms2((tmp_dir, tmp_path))
+        return tmp_path
+
+
+class ControllerCache:
+    """
+    The release cache on the controller.  Each release has a ``.sha1.json`` sidecar that records its checksum (trusted
+    while its size, mtime, and inode are unchanged) and when it was last used.  The least recently used releases are
+    removed when the same ``cache_max_bytes`` / ``cache_keep_versions`` limits that the module applies to the release
+    cache on each host are exceeded.
+
+    An exclusive lock is held on a release while it is downloaded or removed, and a shared lock while it is being
+    transferred to a host, so other worker processes never remove a file that is still in use.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = None, keep_versions: int = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.keep_versions = keep_versions
+
+    @contextmanager
+    def release(self, url: str, checksum: Optional[str]) -> Iterator[Path]:
+        """
+        Download the release with the given URL if it is not already cached and intact, and yield its path.  Only one
+        worker process downloads a given file; any others that need the same file wait for it to finish.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self.path.joinpath(url.rsplit('/', 1)[-1])
+        with _lock_file(path) as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if (data := _read_sidecar(path)) is not None:
+                    found = data['checksum']
+                else:
+                    found = _file_sha1(path) if path.exists() else None
+                if found is None or (checksum and found != checksum):
+                    found = _download(url, path, checksum)
+                _write_sidecar(path, found)
+                fcntl.flock(f, fcntl.LOCK_SH)  # Allow other workers to use this release at the same time
+                self.evict(keep=path)
+                yield path
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def evict(self, keep: Path):
+        """Remove the least recently used releases that are not in use until the size and count limits are satisfied"""
+        if self.keep_versions is None and self.max_bytes is None:
+            return
+
+        entries = []
+        for sidecar_path in self.path.glob('*.sha1.json'):
+            path = sidecar_path.with_name(sidecar_path.name[:-len('.sha1.json')])
+            if (data := _read_sidecar(path)) is not None:
+                entries.append((data.get('last_used', 0), path, data['size']))
+
+        count = len(entries)
+        total = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            over_count = self.keep_versions is not None and count > self.keep_versions
+            over_size = self.max_bytes is not None and total > self.max_bytes
+            if not over_count and not over_size:
+                break
+            elif path == keep:
+                continue
+
+            with _lock_file(path) as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:  # Being downloaded or transferred by another worker
+                    continue
+                for p in (path, _sidecar_path(path)):
+                    if p.exists():
+                        p.unlink()
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+            count -= 1
+            total -= size
+
+
+def _download(url: str, path: Path, checksum: Optional[str]) -> str:
+    part_path = path.with_name(f'{path.name}.part')
+    sha1 = hashlib.sha1()
+    with part_path.open('wb') as f:
+        resp = open_url(url)
+        for chunk in iter(lambda: resp.read(DOWNLOAD_CHUNK_SIZE), b''):
+            f.write(chunk)
+            sha1.update(chunk)
+
+    if checksum and sha1.hexdigest() != checksum:
+        part_path.unlink()
+        raise AnsibleError(f'checksum mismatch for {url} - expected={checksum} found={sha1.hexdigest()}')
+
+    part_path.replace(path)
+    return sha1.hexdigest()
+
+
+def _file_sha1(path: Path) -> str:
+    sha1 = hashlib.sha1()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _sidecar_path(path: Path) -> Path:
+    return path.with_name(f'{path.name}.sha1.json')
+
+
+def _read_sidecar(path: Path) -> Optional[dict]:
+    """The given release's sidecar data, if the sidecar exists and still matches the file"""
+    try:
+        with _sidecar_path(path).open('r', encoding='utf-8') as f:
+            data = json.load(f)
+        stat_info = path.stat()
+    except (OSError, ValueError):
+        return None
+
+    if (data.get('size'), data.get('mtime_ns'), data.get('ino')) == (
+        stat_info.st_size, stat_info.st_mtime_ns, stat_info.st_ino
+    ):
+        return data
+    return None
+
+
+def _write_sidecar(path: Path, checksum: str):
+    """Record the given release's checksum and stat info, and mark it as having just been used"""
+    stat_info = path.stat()
+    data = {
+        'checksum': checksum,
+        'size': stat_info.st_size,
+        'mtime_ns': stat_info.st_mtime_ns,
+        'ino': stat_info.st_ino,
+        'last_used': time.time(),
+    }
+    sidecar_path = _sidecar_path(path)
+    tmp_path = sidecar_path.with_name(f'.{sidecar_path.name}.{os.getpid()}.tmp')
+    with tmp_path.open('w', encoding='utf-8') as f:
+        json.dump(data, f)
+    tmp_path.replace(sidecar_path)
+
+
+@contextmanager
+def _lock_file(path: Path):
+    with path.with_name(f'.{path.name}.lock').open('a') as f:
+        yield f
+
+
+def _int_or_none(value) -> Optional[int]:
+    return None if value is None else int(value)
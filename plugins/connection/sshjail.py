@@ -27,18 +27,86 @@ Copyright (c) 2015 Austin Hyde
 > THE SOFTWARE.
 """
 
+import base64
+import fcntl
+import hashlib
+import io
+import json
 import os
 import pipes
+import re
 import shlex
+import tarfile
+import textwrap
+import time
 from contextlib import contextmanager
 
+from ansible import constants as C
 from ansible.errors import AnsibleError
 from ansible.plugins.connection.ssh import Connection as SSHConnection, DOCUMENTATION as SSH_DOCUMENTATION
-from ansible.module_utils._text import to_text
+from ansible.module_utils._text import to_bytes, to_text
 from ansible.plugins.loader import get_shell_plugin
 
 __metaclass__ = type
 
+_SSH_OPTIONS = SSH_DOCUMENTATION.partition('options:\n')[2]
+_SSHJAIL_OPTIONS = '''
+jls_cache_ttl:
+    description:
+        - The number of seconds for which the result of probing a jail host (the jail connector and the list of jails,
+          which are retrieved in a single round trip) is reused by every jail on that host, instead of probing once
+          per jail.  The list of jails is always refreshed if a jail is not found.
+    type: int
+    default: 60
+    env:
+        - name: ANSIBLE_SSHJAIL_JLS_CACHE_TTL
+    vars:
+        - name: ansible_sshjail_jls_cache_ttl
+jail_host_cache_dir:
+    description:
+        - A directory on the controller in which jail host probe results should be stored, so they can be reused by
+          later runs for up to I(jls_cache_ttl) seconds.  By default, they are only shared within the current run.
+    type: path
+    env:
+        - name: ANSIBLE_SSHJAIL_JAIL_HOST_CACHE_DIR
+    vars:
+        - name: ansible_sshjail_jail_host_cache_dir
+direct_transfer:
+    description:
+        - Transfer files directly to / from their path under the jail's root on the jail host in a single round trip,
+          instead of copying them via a temp file on the jail host.  Without become, the file is transferred via the
+          ssh connection's sftp / scp transfer method; with become, it is streamed through C(dd) as the become user.
+          If a direct transfer fails, the temp file method is used instead.
+    type: bool
+    default: true
+    env:
+        - name: ANSIBLE_SSHJAIL_DIRECT_TRANSFER
+    vars:
+        - name: ansible_sshjail_direct_transfer
+batch_exec:
+    description:
+        - Batch identical commands for different jails on the same jail host into a single ssh invocation.  The first
+          jail to run a given command waits up to I(batch_window) seconds for other jails on the same host to run the
+          same command, then runs it in all of them via one ssh command, and splits the output back to each jail.
+        - Commands that are unique to each host (such as those involving Ansible's remote temp directories) are never
+          batched.  This is most effective with pipelining enabled, and for C(raw) / ad-hoc commands.
+    type: bool
+    default: false
+    env:
+        - name: ANSIBLE_SSHJAIL_BATCH_EXEC
+    vars:
+        - name: ansible_sshjail_batch_exec
+batch_window:
+    description:
+        - The number of seconds to wait for other jails to join a batch when I(batch_exec) is enabled
+    type: float
+    default: 0.25
+    env:
+        - name: ANSIBLE_SSHJAIL_BATCH_WINDOW
+    vars:
+        - name: ansible_sshjail_batch_window
+'''
+
 DOCUMENTATION = '''
     connection: sshjail
     short_description: connect via ssh client binary to jail
@@ -46,8 +114,10 @@ DOCUMENTATION = '''
         - This connection plugin allows ansible to communicate to the target machines via normal ssh command line.
     author: Austin Hyde (@austinhyde)
     version_added: historical
+    extends_documentation_fragment:
+        - connection_pipelining
     options:
-''' + SSH_DOCUMENTATION.partition('options:\n')[2]
+''' + textwrap.indent(_SSHJAIL_OPTIONS.lstrip('\n'), re.match(r' *', _SSH_OPTIONS).group()) + _SSH_OPTIONS
 
 try:
     from __main__ import display
@@ -56,6 +126,131 @@ except ImportError:
     display = Display()
 
 
+class JailHostCache:
+    """
+    Cache of per-jail-host data that is shared by every Connection in the current run.  Tasks for different jails run in
+    separate worker processes, so entries are stored in the run's local temp directory (or the given cache directory,
+    to share them across runs) as well as in memory, and a lock ensures that only one worker populates a given entry
+    while the others wait for it.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._entries = {}
+
+    def _path(self, host, cache_dir=None):
+        if cache_dir:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir, exist_ok=True)
+        else:
+            cache_dir = C.DEFAULT_LOCAL_TMP
+        return os.path.join(cache_dir, 'sshjail_%s_%s.json' % (self.name, re.sub(r'[^\w.-]', '_', host)))
+
+    def get(self, host, func, ttl, refresh=False, cache_dir=None):
+        """
+        :param host: The jail host
+        :param func: Function that returns the JSON-serializable data to cache for the jail host
+        :param ttl: The number of seconds for which a cached entry is valid
+        :param refresh: Whether the cached entry should be replaced, even if it is still valid.  If another worker
+          replaced it while this one was waiting for the lock, then that worker's entry is used.
+        :param cache_dir: The directory in which entries should be stored (default: the run's local temp directory)
+        :return: The cached data for the given jail host
+        """
+        stale = self._entries.get(host) if refresh else None
+        if not refresh:
+            data = self._get_valid(self._entries.get(host), ttl)
+            if data is not None:
+                return data
+
+        path = self._path(host, cache_dir)
+        with _locked(path + '.lock'):
+            entry = _read_json(path)
+            data = self._get_valid(entry, ttl)
+            if data is not None and (not refresh or stale is None or entry['time'] > stale['time']):
+                self._entries[host] = entry
+                return data
+
+            entry = {'time': time.time(), 'data': func()}
+            _write_json(path, entry)
+
+        self._entries[host] = entry
+        return entry['data']
+
+    def _get_valid(self, entry, ttl):
+        if entry and time.time() - entry['time'] < ttl:
+            return entry['data']
+        return None
+
+
+PROBE_CACHE = JailHostCache('probe')
+# Picks the jail connector and lists the jail host's jails in a single round trip.  The exit code is the exit code from
+# jls.
+PROBE_SCRIPT = "(which -s jailme && echo jailme || echo jexec); jls -q jid name host.hostname path"
+BUFSIZE = 65536
+SLEEP_SUFFIX = ' && sleep 0'  # Appended by ActionBase._low_level_execute_command to work around an ssh race condition
+BATCH_HEADER = b'SSHJAIL-BATCH'
+STAT_RECORD_PAT = re.compile(r'^[0-9a-f]{40} [0-7]+ \S+ \S+$')  # sha1, mode, owner, group
+
+
+@contextmanager
+def _locked(path):
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _split(cmd):
+    try:
+        return shlex.split(cmd)
+    except ValueError:  # Not a command that was wrapped by Ansible, e.g., a raw command with unbalanced quotes
+        return []
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _parse_batch_output(stdout):
+    """
+    Split the output of a batched command into a dict of {jid: (rc, stdout, stderr)}.  The output for each jail is
+    framed by a ``SSHJAIL-BATCH <jid> <rc> <stdout length> <stderr length>`` header line.
+    """
+    results = {}
+    pos = stdout.find(BATCH_HEADER)
+    while pos != -1 and pos < len(stdout):
+        end = stdout.index(b'\n', pos)
+        _, jid, rc, out_len, err_len = stdout[pos:end].split()
+        out_start = end + 1
+        err_start = out_start + int(out_len)
+        pos = err_start + int(err_len)
+        results[to_text(jid)] = (int(rc), stdout[out_start:err_start], stdout[err_start:pos])
+    return results
+
+
 # HACK: Ansible core does classname-based validation checks, to ensure connection plugins inherit directly from a class
 # named "ConnectionBase". This intermediate class works around this limitation.
 class ConnectionBase(SSHConnection):
@@ -66,44 +261,85 @@ class Connection(ConnectionBase):
     """ssh based connections"""
 
     transport = 'sshjail'
+    # With pipelining, the module is streamed over stdin through the jail connector, so put_file is not needed
+    has_pipelining = True
 
     def __init__(self, *args, **kwargs):
+        self.jailspec = None
+        self._jail_host = None
         super(Connection, self).__init__(*args, **kwargs)
-        self.inventory_hostname = self.host
-        self.jailspec, self.host = self.host.split('@', 1)  # jail name @ jail host
-        # this way SSHConnection parent class uses the jail host as the SSH remote host
+        self.inventory_hostname = self._play_context.remote_addr
+        if self.jailspec is None:
+            raise AnsibleError("expected a host in the form of <jail name>@<jail host>, but found '%s'" % self.host)
 
         # jail information loaded on first use by match_jail
         self.jid = None
         self.jname = None
         self.jpath = None
         self.connector = None
+        self.jailhost_info = None  # loaded on first use by _probe_jailhost
         # logging.warning(self._play_context.connection)
 
+    @property
+    def host(self):
+        """
+        The jail host.  The ssh connection plugin (re-)sets this to the ``<jail name>@<jail host>`` value of
+        ``ansible_host`` before running commands, so the jail name is split off here.  This way the SSHConnection parent
+        class always uses the jail host as the SSH remote host, and every jail on the same jail host shares the same
+        ControlPath, and therefore one persistent ssh master connection.
+        """
+        return self._jail_host
+
+    @host.setter
+    def host(self, value):
+        if value and '@' in value:
+            self.jailspec, value = value.split('@', 1)  # jail name @ jail host
+        self._jail_host = value
+
     def match_jail(self):
         if self.jid is None:
-            code, stdout, stderr = self._jailhost_command("jls -q jid name host.hostname path")
-            if code != 0:
-                display.vvv("JLS stdout: %s" % stdout)
-                raise AnsibleError("jls returned non-zero!")
-
-            lines = stdout.strip().split(b'\n')
-            found = False
-            for line in lines:
-                if line.strip() == '':
-                    break
-
-                jid, name, hostname, path = to_text(line).strip().split()
-                if name == self.jailspec or hostname == self.jailspec:
-                    self.jid = jid
-                    self.jname = name
-                    self.jpath = path
-                    found = True
-                    break
-
-            if not found:
+            jail = self._find_jail(self._get_jails())
+            if jail is None:  # The jail may have been started since the cached list of jails was retrieved
+                jail = self._find_jail(self._get_jails(refresh=True))
+            if jail is None:
                 raise AnsibleError("failed to find a jail with name or hostname of '%s'" % self.jailspec)
 
+            self.jid, self.jname, self.jpath = jail
+
+    def _find_jail(self, jails):
+        for jid, name, hostname, path in jails:
+            if name == self.jailspec or hostname == self.jailspec:
+                return jid, name, path
+        return None
+
+    def _get_jails(self, refresh=False):
+        """The (jid, name, hostname, path) of each jail on the jail host, shared by all jails on the same host"""
+        return self._probe_jailhost(refresh)['jails']
+
+    def _probe_jailhost(self, refresh=False):
+        """
+        The jail connector and list of jails for the jail host.  The jail host is probed once for all jails on that
+        host, instead of separately checking for jailme and running jls for each jail.
+        """
+        if self.jailhost_info is None or refresh:
+            self.jailhost_info = PROBE_CACHE.get(
+                self.host,
+                self._run_probe,
+                self.get_option('jls_cache_ttl'),
+                refresh,
+                self.get_option('jail_host_cache_dir'),
+            )
+        return self.jailhost_info
+
+    def _run_probe(self):
+        code, stdout, stderr = self._jailhost_command(PROBE_SCRIPT)
+        lines = [to_text(line).strip() for line in stdout.strip().splitlines()]
+        if code != 0 or not lines:
+            display.vvv("JLS stdout: %s" % stdout)
+            raise AnsibleError("jls returned non-zero!")
+
+        return {'connector': lines[0], 'jails': [line.split() for line in lines[1:] if line]}
+
     def get_jail_path(self):
         self.match_jail()
         return self.jpath
@@ -114,67 +350,163 @@ class Connection(ConnectionBase):
 
     def get_jail_connector(self):
         if self.connector is None:
-            code, _, _ = self._jailhost_command("which -s jailme")
-            if code != 0:
-                self.connector = 'jexec'
-            else:
-                self.connector = 'jailme'
+            self.connector = self._probe_jailhost()['connector']
         return self.connector
 
-    def _strip_sudo(self, executable, cmd):
-        words = shlex.split(cmd)
-        while words[0] == executable or words[0] == 'sudo':
-            cmd = words[-1]
-            words = shlex.split(cmd)
-
-        cmd = cmd.split(' ; ', 1)[1]
-
-        # # Get the command without sudo
-        # sudoless = cmd.rsplit(executable + ' -c ', 1)[1]
-        # # Get the quotes
-        # quotes = sudoless.partition('echo')[0]
-        # # Get the string between the quotes
-        # cmd = sudoless[len(quotes):-len(quotes+'?')]
-        # # Drop the first command becasue we don't need it
-        # cmd = cmd.split('; ', 1)[1]
-        return cmd
+    def _unwrap_command(self, cmd, executable):
+        """
+        Undo the wrapping that ActionBase._low_level_execute_command applies to commands (the executable, the
+        ``sleep 0`` race mitigation, and become), so the command can be run in the jail via the jail connector, with
+        become applied on the jail host instead.
 
-    def _strip_sleep(self, cmd):
-        # Get the command without sleep
-        cmd = cmd.split(' && sleep 0', 1)[0]
-        # Add back trailing quote
-        cmd = '%s%s' % (cmd, "'")
-        return cmd
+        :return: Tuple of (command, whether ``sleep 0`` was appended)
+        """
+        words = _split(cmd)
+        if len(words) == 3 and words[1] == '-c' and words[0] in (executable, self._play_context.executable):
+            cmd = words[2]
 
-    def _jailhost_command(self, cmd):
-        return super(Connection, self).exec_command(cmd, in_data=None, sudoable=True)
+        sleep = cmd.endswith(SLEEP_SUFFIX)
+        if sleep:
+            cmd = cmd[:-len(SLEEP_SUFFIX)]
 
-    def exec_command(self, cmd, in_data=None, executable='/bin/sh', sudoable=True):
-        ''' run a command in the jail '''
-        slpcmd = False
+        success = getattr(self.become, 'success', None) if self.become else None
+        if success:
+            # The become plugin runs: <become_exe> <flags> <executable> -c '<echo> <success> <sep> <cmd>'
+            marker = '%s %s %s ' % (self._shell.ECHO, success, self._shell.COMMAND_SEP)
+            words = _split(cmd)
+            if words and words[-1].startswith(marker):
+                cmd = words[-1][len(marker):]
 
-        if '&& sleep 0' in cmd:
-            slpcmd = True
-            cmd = self._strip_sleep(cmd)
+        return cmd, sleep
 
-        if 'sudo' in cmd:
-            cmd = self._strip_sudo(executable, cmd)
+    def _jailhost_command(self, cmd):
+        return super(Connection, self).exec_command(cmd, in_data=None, sudoable=True)
 
-        cmd = ' '.join([executable, '-c', pipes.quote(cmd)])
-        if slpcmd:
-            cmd = '%s %s %s %s' % (self.get_jail_connector(), self.get_jail_id(), cmd, '&& sleep 0')
-        else:
-            cmd = '%s %s %s' % (self.get_jail_connector(), self.get_jail_id(), cmd)
+    def _jailhost_transfer(self, cmd, in_data=None):
+        """Run a command on the jail host without a tty, so binary stdin / stdout are passed through unmodified"""
+        ssh_cmd = self._build_command(self.get_option('ssh_executable'), 'ssh', self.host, cmd)
+        return self._run(ssh_cmd, in_data, sudoable=True)
 
+    def _become_command(self, cmd, executable='/bin/sh'):
         if self._play_context.become:
-            # display.debug("_low_level_execute_command(): using become for this command")
             plugin = self.become
             shell = get_shell_plugin(executable=executable)
             cmd = plugin.build_become_command(cmd, shell)
+        return cmd
+
+    def exec_command(self, cmd, in_data=None, executable='/bin/sh', sudoable=True):
+        '''
+        run a command in the jail
+
+        When pipelining, ``in_data`` is the module payload, which is streamed to the command in the jail over the same
+        ssh invocation.
+        '''
+        cmd, sleep = self._unwrap_command(cmd, executable)
+        if self.get_option('batch_exec') and 'ansible-tmp-' not in cmd:
+            return self._exec_batched(cmd, in_data, executable)
+
+        cmd = ' '.join([executable, '-c', pipes.quote(cmd)])
+        cmd = '%s %s %s' % (self.get_jail_connector(), self.get_jail_id(), cmd)
+        if sleep:
+            cmd += SLEEP_SUFFIX
+
+        # The jail connector needs to run as root on the jail host
+        cmd = self._become_command(cmd, executable)
 
         # display.vvv("JAIL (%s) %s" % (local_cmd), host=self.host)
         return super(Connection, self).exec_command(cmd, in_data, True)
 
+    def exec_in_jails(self, jids, cmd, in_data=None, executable='/bin/sh'):
+        """
+        Run the given command in each of the given jails on this connection's jail host (in parallel), via a single ssh
+        invocation.  If provided, ``in_data`` is passed to the command in each jail on stdin.
+
+        :return: Dict of {jid: (rc, stdout, stderr)}
+        """
+        jail_cmd = '%s "$j" %s' % (self.get_jail_connector(), ' '.join([executable, '-c', pipes.quote(cmd)]))
+        jids = ' '.join(pipes.quote(jid) for jid in jids)
+        script = [
+            'd=$(mktemp -d) || exit 1',
+            'cat > "$d/in"' if in_data else ': > "$d/in"',
+            'for j in %s; do (%s < "$d/in" > "$d/$j.out" 2> "$d/$j.err"; echo $? > "$d/$j.rc") & done' % (
+                jids, jail_cmd
+            ),
+            'wait',
+            'for j in %s; do' % jids,
+            '  printf "%s %%s %%s %%s %%s\\n" "$j" $(cat "$d/$j.rc") $(wc -c < "$d/$j.out") $(wc -c < "$d/$j.err")' % (
+                to_text(BATCH_HEADER)
+            ),
+            '  cat "$d/$j.out" "$d/$j.err"',
+            'done',
+            'rm -rf "$d"',
+        ]
+        host_cmd = self._become_command(' '.join([executable, '-c', pipes.quote('\n'.join(script))]), executable)
+        display.vvv(u"BATCH EXEC IN JAILS {0}: {1}".format(jids, cmd), host=self.host)
+        code, stdout, stderr = self._jailhost_transfer(host_cmd, in_data)
+        results = _parse_batch_output(stdout)
+        if code != 0 or len(results) != len(jids.split()):
+            raise AnsibleError("batched command failed on %s (rc=%s):\n%s\n%s" % (self.host, code, stdout, stderr))
+        return results
+
+    def _exec_batched(self, cmd, in_data, executable):
+        """
+        Run the given command in this jail as part of a batch with any other jails on the same jail host that run the
+        identical command within the batch window.  Each jail's task runs in a separate worker process, so workers
+        rendezvous via a state file in the run's local temp directory.  The first worker to arrive leads the batch: it
+        waits for others to join, runs the command in every jail that joined, and writes the results for the others.
+        """
+        # The batch runs over the leader's ssh connection with its become settings, so only jails with the same ssh
+        # identity and become settings may share a batch
+        if self._play_context.become and self.become:
+            become = (self.become.name, self.become.get_option('become_user') or '')
+        else:
+            become = ('', '')
+        identity = tuple(self.get_option(opt) or '' for opt in ('remote_user', 'port', 'private_key_file'))
+        key_parts = (self.host, self.get_jail_connector(), executable, cmd, in_data or b'') + identity + become
+        key = hashlib.sha1(b'\0'.join(to_bytes(v) for v in key_parts)).hexdigest()[:16]
+        base_path = os.path.join(C.DEFAULT_LOCAL_TMP, 'sshjail_batch_%s' % key)
+        jid = self.get_jail_id()
+        with _locked(base_path + '.lock'):
+            state = _read_json(base_path + '.json')
+            leader = not state or state['closed']
+            if leader:
+                batch_id = '%d-%s' % (os.getpid(), time.time())
+                state = {'id': batch_id, 'leader': os.getpid(), 'jails': [], 'closed': False}
+            state['jails'].append(jid)
+            _write_json(base_path + '.json', state)
+
+        result_path = '%s_%s.result' % (base_path, state['id'])
+        if leader:
+            time.sleep(self.get_option('batch_window'))
+            with _locked(base_path + '.lock'):
+                state = _read_json(base_path + '.json')
+                state['closed'] = True
+                _write_json(base_path + '.json', state)
+
+            try:
+                results = self.exec_in_jails(state['jails'], cmd, in_data, executable)
+            except Exception as e:
+                _write_json(result_path, {'error': to_text(e)})
+                raise
+
+            encoded = {
+                j: [rc, to_text(base64.b64encode(out)), to_text(base64.b64encode(err))]
+                for j, (rc, out, err) in results.items()
+            }
+            _write_json(result_path, {'results': encoded})
+            return results[jid]
+
+        while not os.path.exists(result_path):
+            if not _pid_exists(state['leader']):
+                raise AnsibleError("the worker running the batched command on %s exited unexpectedly" % self.host)
+            time.sleep(0.05)
+
+        data = _read_json(result_path)
+        if 'error' in data:
+            raise AnsibleError("batched command failed on %s: %s" % (self.host, data['error']))
+        rc, out, err = data['results'][jid]
+        return rc, base64.b64decode(out), base64.b64decode(err)
+
     def _normalize_path(self, path, prefix):
         if not path.startswith(os.path.sep):
             path = os.path.join(os.path.sep, path)
@@ -182,11 +514,7 @@ class Connection(ConnectionBase):
         return os.path.join(prefix, normpath[1:])
 
     def _copy_file(self, from_file, to_file, executable='/bin/sh'):
-        copycmd = ' '.join(('cp', from_file, to_file))
-        if self._play_context.become:
-            plugin = self.become
-            shell = get_shell_plugin(executable=executable)
-            copycmd = plugin.build_become_command(copycmd, shell)
+        copycmd = self._become_command(' '.join(('cp', from_file, to_file)), executable)
 
         display.vvv(u"REMOTE COPY {0} TO {1}".format(from_file, to_file), host=self.inventory_hostname)
         code, stdout, stderr = self._jailhost_command(copycmd)
@@ -213,6 +541,11 @@ class Connection(ConnectionBase):
     def put_file(self, in_path, out_path):
         ''' transfer a file from local to remote jail '''
         out_path = self._normalize_path(out_path, self.get_jail_path())
+        if self.get_option('direct_transfer'):
+            try:
+                return self._put_file_direct(in_path, out_path)
+            except AnsibleError as e:
+                display.vvv(u"DIRECT PUT FAILED, FALLING BACK TO TEMP FILE: %s" % e, host=self.inventory_hostname)
 
         with self.tempfile() as tmp:
             super(Connection, self).put_file(in_path, tmp)
@@ -221,7 +554,132 @@ class Connection(ConnectionBase):
     def fetch_file(self, in_path, out_path):
         ''' fetch a file from remote to local '''
         in_path = self._normalize_path(in_path, self.get_jail_path())
+        if self.get_option('direct_transfer'):
+            try:
+                return self._fetch_file_direct(in_path, out_path)
+            except AnsibleError as e:
+                display.vvv(u"DIRECT FETCH FAILED, FALLING BACK TO TEMP FILE: %s" % e, host=self.inventory_hostname)
 
         with self.tempfile() as tmp:
             self._copy_file(in_path, tmp)
             super(Connection, self).fetch_file(tmp, out_path)
+
+    def _put_file_direct(self, in_path, out_path):
+        if not self._play_context.become:
+            return super(Connection, self).put_file(in_path, out_path)
+
+        display.vvv(u"PUT {0} TO {1}".format(in_path, out_path), host=self.inventory_hostname)
+        with open(to_bytes(in_path, errors='surrogate_or_strict'), 'rb') as f:
+            in_data = f.read()
+
+        count = '' if in_data else ' count=0'
+        cmd = self._become_command('dd of=%s bs=%d%s' % (pipes.quote(out_path), BUFSIZE, count))
+        code, stdout, stderr = self._jailhost_transfer(cmd, in_data)
+        if code != 0:
+            raise AnsibleError("failed to transfer file to %s:\n%s\n%s" % (out_path, stdout, stderr))
+
+    def _fetch_file_direct(self, in_path, out_path):
+        if not self._play_context.become:
+            return super(Connection, self).fetch_file(in_path, out_path)
+
+        display.vvv(u"FETCH {0} TO {1}".format(in_path, out_path), host=self.inventory_hostname)
+        cmd = self._become_command('dd if=%s bs=%d' % (pipes.quote(in_path), BUFSIZE))
+        code, stdout, stderr = self._jailhost_transfer(cmd)
+        if code != 0:
+            raise AnsibleError("failed to transfer file from %s:\n%s\n%s" % (in_path, stdout, stderr))
+
+        with open(to_bytes(out_path, errors='surrogate_or_strict'), 'wb') as f:
+            f.write(stdout)
+
+    def put_files(self, files, owner=None, group=None):
+        """
+        Transfer multiple files into the jail in a single round trip, as one tar stream that is unpacked directly under
+        the jail's root on the jail host.
+
+        :param files: Iterable of (local path, path in the jail, mode) tuples.  If mode is None, then the local file's
+          mode is used.
+        :param owner: The user that should own the files (default: the user that unpacks them)
+        :param group: The group that should own the files (default: the primary group of the user that unpacks them)
+        """
+        paths = []
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tar:
+            for in_path, out_path, mode in files:
+                out_path = self._normalize_path(out_path, os.path.sep)
+                paths.append(out_path)
+                info = tar.gettarinfo(in_path, arcname=out_path.lstrip(os.path.sep))
+                if mode is not None:
+                    info.mode = mode
+                with open(to_bytes(in_path, errors='surrogate_or_strict'), 'rb') as f:
+                    tar.addfile(info, f)
+
+        display.vvv(u"PUT {0} FILES TO {1}".format(len(paths), self.get_jail_path()), host=self.inventory_hostname)
+        # Ownership is applied inside the jail, so user and group names are resolved via the jail's passwd / group files
+        cmd = 'tar -xpof - -C %s' % pipes.quote(self.get_jail_path())
+        if owner or group:
+            spec = pipes.quote('%s%s' % (owner or '', ':' + group if group else ''))
+            chown = 'chown %s %s' % (spec, ' '.join(map(pipes.quote, paths)))
+            cmd += ' && %s %s /bin/sh -c %s' % (self.get_jail_connector(), self.get_jail_id(), pipes.quote(chown))
+
+        code, stdout, stderr = self._jailhost_transfer(self._become_command(cmd), buf.getvalue())
+        if code != 0:
+            raise AnsibleError("failed to transfer files to %s:\n%s\n%s" % (self.get_jail_path(), stdout, stderr))
+
+    def fetch_files(self, files):
+        """
+        Fetch multiple files from the jail in a single round trip, as one tar stream that is packed directly from under
+        the jail's root on the jail host.
+
+        :param files: Iterable of (path in the jail, local path) tuples
+        """
+        out_paths = {self._normalize_path(in_path, os.path.sep).lstrip(os.path.sep): out for in_path, out in files}
+        jail_path = self.get_jail_path()
+        cmd = 'tar -cf - -C %s %s' % (pipes.quote(jail_path), ' '.join(map(pipes.quote, out_paths)))
+        display.vvv(u"FETCH {0} FILES FROM {1}".format(len(out_paths), jail_path), host=self.inventory_hostname)
+        code, stdout, stderr = self._jailhost_transfer(self._become_command(cmd))
+        if code != 0:
+            raise AnsibleError("failed to transfer files from %s:\n%s\n%s" % (jail_path, stdout, stderr))
+
+        fetched = set()
+        with tarfile.open(fileobj=io.BytesIO(stdout), mode='r') as tar:
+            for member in tar:
+                if not member.isfile() or member.name not in out_paths:
+                    continue
+                out_path = to_bytes(out_paths[member.name], errors='surrogate_or_strict')
+                os.makedirs(os.path.dirname(out_path) or b'.', exist_ok=True)
+                tmp_path = out_path + b'.%d.tmp' % os.getpid()
+                with open(tmp_path, 'wb') as f:
+                    f.write(tar.extractfile(member).read())
+                os.replace(tmp_path, out_path)
+                fetched.add(member.name)
+
+        missing = sorted(set(out_paths) - fetched)
+        if missing:
+            raise AnsibleError("failed to fetch %s from %s: not regular files" % (', '.join(missing), jail_path))
+
+    def stat_files(self, paths):
+        """
+        Retrieve the sha1 checksum, mode, owner, and group of multiple files in the jail in a single round trip.
+
+        :param paths: Paths in the jail
+        :return: Dict of {path: (sha1, mode, owner, group)}, where the value is None for files that do not exist
+        """
+        # Each file's record is terminated by a NUL byte, so unexpected output can't be mistaken for another record
+        script = '; '.join(
+            'if [ -f %s ]; then printf "%%s %%s\\000" "$(sha1 -q %s)" "$(stat -f "%%Lp %%Su %%Sg" %s)";'
+            ' else printf "%%s\\000" -; fi' % ((q,) * 3)
+            for q in map(pipes.quote, paths)
+        )
+        cmd = '%s %s /bin/sh -c %s' % (self.get_jail_connector(), self.get_jail_id(), pipes.quote(script))
+        code, stdout, stderr = self._jailhost_transfer(self._become_command(cmd))
+        records = to_text(stdout).split('\0')
+        if code != 0 or records.pop() != '' or len(records) != len(paths):
+            raise AnsibleError("failed to stat files in %s:\n%s\n%s" % (self.jailspec, stdout, stderr))
+
+        results = {}
+        for path, record in zip(paths, records):
+            fields = None if record == '-' else tuple(record.split(' '))
+            if fields is not None and (len(fields) != 4 or not STAT_RECORD_PAT.match(record)):
+                raise AnsibleError("unexpected stat output for %s in %s: %r" % (path, self.jailspec, record))
+            results[path] = fields
+        return results
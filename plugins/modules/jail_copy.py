@@ -0,0 +1,51 @@
+"""
+Documentation for the ``jail_copy`` action plugin, which is implemented entirely in plugins/action/jail_copy.py.
+
+:author: Doug Skrypa
+"""
+
+DOCUMENTATION = """
+---
+module: jail_copy
+short_description: Copy files into FreeBSD jails in bulk
+description:
+    - Copy a file or directory tree into a jail.  With the C(sshjail) connection, all destination files are checked in
+      one round trip, and all new or changed files are transferred in one more round trip as a single tar stream that
+      is unpacked directly under the jail's root on the jail host.
+    - With any other connection, the task is handled by the C(copy) action.
+options:
+    src:
+        description:
+            - The local file or directory to copy.  If it is a directory, then its contents are copied into I(dest) if
+              it ends with C(/), otherwise the directory itself is copied into I(dest).
+        required: true
+        type: path
+    dest:
+        description:
+            - The destination path in the jail.  If I(src) is a file and this ends with C(/), then the file is copied
+              into this directory.
+        required: true
+        type: path
+    mode:
+        description:
+            - The octal mode to apply to copied files.  By default, the mode of each local file is used.
+        type: raw
+    owner:
+        description:
+            - The user that should own copied files, as resolved in the jail
+        type: str
+    group:
+        description:
+            - The group that should own copied files, as resolved in the jail
+        type: str
+author: dskrypa
+"""
+
+EXAMPLES = """
+- name: Push config files into every jail
+  jail_copy:
+    src: files/etc/
+    dest: /usr/local/etc/
+    owner: root
+    group: wheel
+"""
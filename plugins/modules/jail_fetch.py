@@ -0,0 +1,45 @@
+"""
+Documentation for the ``jail_fetch`` action plugin, which is implemented entirely in plugins/action/jail_fetch.py.
+
+:author: Doug Skrypa
+"""
+
+DOCUMENTATION = """
+---
+module: jail_fetch
+short_description: Fetch files from FreeBSD jails in bulk
+description:
+    - Fetch one or more files from a jail to the controller.  With the C(sshjail) connection, all source files are
+      checked in one round trip, and all new or changed files are transferred in one more round trip as a single tar
+      stream that is packed directly from under the jail's root on the jail host.
+    - With any other connection, each file is handled by the C(fetch) action.
+options:
+    src:
+        description:
+            - The file or list of files in the jail to fetch.  Each file must exist.
+        required: true
+        type: list
+        elements: path
+    dest:
+        description:
+            - The local directory in which files should be saved.  Unless I(flat) is true, each file is saved as
+              C(<dest>/<inventory_hostname>/<src>), like the C(fetch) module does.
+        required: true
+        type: path
+    flat:
+        description:
+            - Save each file directly in I(dest) as its base name, without the host name and source directories.  If
+              I(src) is a single file and I(dest) does not end with C(/), then the file is saved as I(dest).
+        type: bool
+        default: false
+author: dskrypa
+"""
+
+EXAMPLES = """
+- name: Collect Plex logs from every jail
+  jail_fetch:
+    src:
+      - /usr/local/plex_media_server/Plex Media Server/Logs/Plex Media Server.log
+      - /var/log/messages
+    dest: fetched/
+"""
@@ -4,26 +4,54 @@ Ansible module for installing / upgrading Plex Media Server with PlexPass.
 Only FreeBSD is technically supported right now, but it has support for downloading on other OSes.  The install method
 would need to change for different OSes, and the default install path would likely be different as well.
 
+This file can also be run directly to mirror releases into a local directory with the same layout as plex.tv, which
+can then be served on the LAN and used via the ``download_base_url`` option::
+
+    python plex.py mirror -t <x_plex_token> -d /srv/plex_mirror -r freebsd:freebsd-x86_64 -r linux:linux-x86_64:debian
+
 :author: Doug Skrypa
 """
 
+import fcntl
 import hashlib
 import json
+import os
 import platform
+import re
 import shutil
+import stat
+import sys
 import time
-from functools import cached_property
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import cached_property, partial
+from http.client import HTTPConnection, HTTPSConnection, HTTPResponse, HTTPException
 from pathlib import Path
 from shlex import shlex
-from subprocess import check_call, check_output, SubprocessError
-from tarfile import TarFile
-from tempfile import TemporaryDirectory
-from typing import Optional, Union, Any, Dict, FrozenSet, Tuple
-from urllib.parse import urlencode
-
-from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+from ssl import SSLSession, create_default_context
+from subprocess import Popen, PIPE, DEVNULL
+from tarfile import TarFile, TarInfo
+from queue import Queue, Full
+from tempfile import mkdtemp, mkstemp
+from threading import Thread, Event, Lock
+from typing import Optional, Union, Any, Dict, FrozenSet, Tuple, Iterable, Iterator, BinaryIO, List, Set, Callable
+from urllib.parse import urlencode, urlsplit, urljoin
+from urllib.request import getproxies, proxy_bypass
+
+from ansible.module_utils.basic import AnsibleModule
 
 DEFAULT_CACHE_DIR = '/var/tmp/plex/ansible_cache/'
+FEED_URL = 'https://plex.tv/api/downloads/5.json'
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+RANGE_SEGMENT_SIZE = 8 * 1024 * 1024
+# Multi-threaded decompressors to use instead of Python's single-threaded implementations, in order of preference
+PARALLEL_DECOMPRESSORS = {
+    '.bz2': (('lbzip2', '-dc'), ('pbzip2', '-dc')),
+    '.gz': (('pigz', '-dc'),),
+    '.xz': (('xz', '-dc', '-T0'),),
+    '.zst': (('zstd', '-dc', '-T0'),),
+}
 # TODO: Different default path based on OS?
 INSTALL_PATH_DEFAULT = '/usr/local/share/plex_media_server'     # immutable binaries; owner of contents: root
 # PLEX_HOME_DEFAULT = '/usr/local/plex_media_server'              # mutable; owner of contents: plex
@@ -43,7 +71,8 @@ options:
         type: str
     plex_install_path:
         description:
-            - The directory in which Plex should be installed
+            - The directory in which Plex should be installed.  Each version is extracted to a directory in
+              C(<plex_install_path>.versions), and this path is a symlink to the active version.
         default: {INSTALL_PATH_DEFAULT}
         type: str
     verify_download_checksum:
@@ -58,9 +87,109 @@ options:
         default: None
     version:
         description:
-            - The specific version to install
+            - The specific version to install.  When I(state=rollback), the previously installed version to activate
+              (default: the most recently active previous version).
         type: str
         default: latest
+    state:
+        description:
+            - C(present) installs the target version.  If that version was kept via I(keep_previous), then the kept
+              directory is re-activated instead of extracting it again.  C(rollback) re-activates a previously
+              installed version that was kept via I(keep_previous), without downloading or extracting anything.
+              C(resolved) only reports the target release's URL, checksum and release cache path, which is used by the
+              C(plex) action plugin.  It does not verify or update the release cache, so it is safe for read-only
+              version checks.
+            - C(staged) downloads, verifies, and extracts the target version into C(<plex_install_path>.versions)
+              without activating it, so it can be done while Plex is running.  C(active) only activates the staged
+              version, which is fast enough to do between stopping and starting Plex.  The staged version is not
+              activated if it is not newer than the installed version.
+        type: str
+        choices: [present, staged, active, rollback, resolved]
+        default: present
+    keep_previous:
+        description:
+            - The number of previously active versions to keep in C(<plex_install_path>.versions) for rollback.  The
+              value used by the last C(present) or C(staged) run is saved, and is used when a staged version is
+              activated via C(active).  Kept versions are never removed when I(state=rollback).
+        type: int
+        default: 0
+    download_connections:
+        description:
+            - The number of parallel connections to use when the server supports HTTP Range requests.  Interrupted
+              downloads are resumed from the partial C(.part) file on the next run.
+        type: int
+        default: 4
+    streaming_install:
+        description:
+            - When the target release is not cached, extract it while it is being downloaded instead of waiting for
+              the download to finish.  The verified release is still saved in the release cache.
+        type: bool
+        default: False
+    extract_backend:
+        description:
+            - C(auto) uses a multi-threaded decompressor (lbzip2, pbzip2, pigz, xz, or zstd, depending on the release
+              archive type) when one is installed, and falls back to Python's tarfile module otherwise.  C(python)
+              always uses Python's tarfile module.  The backend that was used is reported as C(extract_backend).
+        type: str
+        choices: [auto, python]
+        default: auto
+    delta_install:
+        description:
+            - Hard link files that are identical (same size, permissions and content) to the same file in the active
+              install instead of writing them again, so only new or changed files are written.  The number of linked
+              and written files is reported as C(delta_install).
+        type: bool
+        default: False
+    feed_cache_ttl:
+        description:
+            - The number of seconds for which the cached downloads feed is used without checking for changes.  After
+              that, a conditional request is made, so an unchanged feed is not downloaded again.
+        type: int
+        default: 600
+    feed_stale_while_revalidate:
+        description:
+            - When the cached downloads feed is older than I(feed_cache_ttl), use it anyway and refresh it in a
+              background process for the next run.  The feed is not refreshed in check mode.
+        type: bool
+        default: False
+    download_base_url:
+        description:
+            - The base URL of a local mirror of plex.tv releases, such as one populated by running this module's file
+              with C(python plex.py mirror).  Release files are downloaded from the same path relative to this URL
+              instead of from plex.tv.  If a release is not available in the mirror, then it is downloaded from plex.tv.
+        type: str
+        default: None
+    controller_cache_dir:
+        description:
+            - Handled by the C(plex) action plugin.  The directory on the controller in which releases are cached.
+              Each release is downloaded once on the controller and copied to every host that needs it.
+        type: str
+        default: ~/.cache/ansible_plex/releases/
+    release_src:
+        description:
+            - Set by the C(plex) action plugin.  The path of a release file that was transferred from the controller.
+              It is moved into the release cache and verified while holding the same lock that is used for downloads,
+              before the release is installed.
+        type: path
+        default: None
+    timings_log:
+        description:
+            - Append the per-phase timings that are reported as C(timings) to C(timings.jsonl) in the cache directory
+              after each install attempt
+        type: bool
+        default: False
+    cache_max_bytes:
+        description:
+            - The maximum total size of cached release files.  The least recently used releases are removed when the
+              limit is exceeded.  By default, the cache size is not limited.
+        type: int
+        default: None
+    cache_keep_versions:
+        description:
+            - The maximum number of cached release files to keep.  The least recently used releases are removed when
+              the limit is exceeded.  By default, the number of cached releases is not limited.
+        type: int
+        default: None
 author: dskrypa
 notes:
   - WIP
@@ -71,6 +200,26 @@ EXAMPLES = """
   plex:
     x_plex_token: "{{ x_plex_token }}"
     plex_install_path: /usr/local/plex/
+    keep_previous: 2
+
+- name: Download and extract the latest Plex version while Plex is running
+  plex:
+    x_plex_token: "{{ x_plex_token }}"
+    plex_install_path: /usr/local/plex/
+    state: staged
+
+- name: Activate the staged Plex version
+  plex:
+    x_plex_token: "{{ x_plex_token }}"
+    plex_install_path: /usr/local/plex/
+    state: active
+  register: activate_result
+
+- name: Roll back to the previous Plex version
+  plex:
+    x_plex_token: "{{ x_plex_token }}"
+    plex_install_path: /usr/local/plex/
+    state: rollback
 """
 
 
@@ -82,18 +231,25 @@ def main():
             'verify_download_checksum': {'default': True, 'type': 'bool'},
             'distro': {'type': 'str', 'default': None},
             'version': {'type': 'str', 'default': 'latest'},
+            'state': {
+                'type': 'str', 'default': 'present', 'choices': ['present', 'staged', 'active', 'rollback', 'resolved']
+            },
+            'keep_previous': {'type': 'int', 'default': 0},
+            'download_connections': {'type': 'int', 'default': 4},
+            'streaming_install': {'type': 'bool', 'default': False},
+            'extract_backend': {'type': 'str', 'default': 'auto', 'choices': ['auto', 'python']},
+            'delta_install': {'type': 'bool', 'default': False},
+            'feed_cache_ttl': {'type': 'int', 'default': 600},
+            'feed_stale_while_revalidate': {'type': 'bool', 'default': False},
+            'timings_log': {'type': 'bool', 'default': False},
+            'download_base_url': {'type': 'str', 'default': None},
+            'release_src': {'type': 'path', 'default': None},
+            'cache_max_bytes': {'type': 'int', 'default': None},
+            'cache_keep_versions': {'type': 'int', 'default': None},
         },
         supports_check_mode=True,
     )
 
-    # TODO: Catch error for missing requests/curl and return something similar to below
-    # if REQUESTS_IMP_ERR is not None:
-    #     module.fail_json(
-    #         msg=missing_required_lib('requests', url='https://pypi.org/project/requests/'),
-    #         exception=REQUESTS_IMP_ERR,
-    #     )
-    #     return  # Not reachable, but makes PyCharm happy
-
     args = module.params
     installer = PlexInstaller(
         x_plex_token=args['x_plex_token'],
@@ -101,7 +257,23 @@ def main():
         verify_checksum=args['verify_download_checksum'],
         distro=args['distro'],
         version=args['version'],
+        download_connections=args['download_connections'],
+        cache_max_bytes=args['cache_max_bytes'],
+        cache_keep_versions=args['cache_keep_versions'],
+        keep_previous=args['keep_previous'],
+        feed_cache_ttl=args['feed_cache_ttl'],
+        feed_stale_while_revalidate=args['feed_stale_while_revalidate'],
+        streaming_install=args['streaming_install'],
+        extract_backend=args['extract_backend'],
+        delta_install=args['delta_install'],
+        download_base_url=args['download_base_url'],
+        check_mode=module.check_mode,
     )
+    if args['state'] == 'rollback':
+        return rollback(module, installer)
+    elif args['state'] == 'active':
+        return activate_staged(module, installer)
+
     meta = {'action': 'install' if installer.installed_version is None else 'update'}
 
     try:
@@ -111,16 +283,89 @@ def main():
         module.fail_json(msg=str(e), **meta)
         return  # Not reachable, but makes PyCharm happy
 
+    if args['state'] == 'resolved':
+        try:
+            meta['release'] = installer.release_details()
+        except PlexInstallError as e:
+            module.fail_json(msg=str(e), **meta)
+        module.exit_json(changed=False, msg=reason, needs_install=needs_install, **meta)
+        return  # Not reachable, but makes PyCharm happy
+
+    staging = args['state'] == 'staged'
+    if staging and needs_install and (staged_dir := installer.staged_dir) is not None:
+        if _read_version(staged_dir) == installer.target_version:
+            module.exit_json(changed=False, msg=f'Version {installer.target_version} is already staged', **meta)
+            return  # Not reachable, but makes PyCharm happy
+
     if module.check_mode or not needs_install:
-        module.exit_json(changed=needs_install, msg=reason, **meta)
+        module.exit_json(changed=needs_install, msg=reason, timings=installer.timer.results(), **meta)
         return  # Not reachable, but makes PyCharm happy
 
     try:
-        installer.install()
+        if args['release_src']:
+            installer.import_release(Path(args['release_src']))
+        if staging:
+            installer.stage()
+        else:
+            installer.install()
     except PlexInstallError as e:
+        meta['timings'] = installer.timer.results()
+        if args['timings_log']:
+            installer.log_timings(meta, error=str(e))
         module.fail_json(msg=str(e), **meta)
     else:
-        module.exit_json(changed=True, msg=f'Installed Plex Media Server version={installer.latest_version}', **meta)
+        meta['timings'] = installer.timer.results()
+        if args['timings_log']:
+            installer.log_timings(meta)
+        meta['extract_backend'] = installer.extract_backend
+        if installer.delta_stats is not None:
+            meta['delta_install'] = installer.delta_stats
+        action = 'Staged' if staging else 'Installed'
+        module.exit_json(changed=True, msg=f'{action} Plex Media Server version={installer.target_version}', **meta)
+
+
+def rollback(module: AnsibleModule, installer: 'PlexInstaller'):
+    meta = {'action': 'rollback'}
+    try:
+        version_dir = installer.rollback_dir()
+    except PlexInstallError as e:
+        module.fail_json(msg=str(e), **meta)
+        return  # Not reachable, but makes PyCharm happy
+
+    target = _read_version(version_dir)
+    meta['versions'] = {'installed': installer.installed_version, 'target': target}
+    if installer.active_dir == version_dir.resolve():
+        module.exit_json(changed=False, msg=f'Version {target} is already active', **meta)
+        return  # Not reachable, but makes PyCharm happy
+
+    if not module.check_mode:
+        installer.activate(version_dir)
+    module.exit_json(changed=True, msg=f'Rolled back Plex Media Server to version={target}', **meta)
+
+
+def activate_staged(module: AnsibleModule, installer: 'PlexInstaller'):
+    meta = {'action': 'activate'}
+    if (version_dir := installer.staged_dir) is None:
+        module.exit_json(changed=False, msg='There is no staged version to activate', **meta)
+        return  # Not reachable, but makes PyCharm happy
+
+    target = _read_version(version_dir)
+    meta['versions'] = {'installed': installer.installed_version, 'target': target}
+    if installer.version not in ('latest', target):
+        module.fail_json(msg=f'The staged version={target} does not match version={installer.version}', **meta)
+        return  # Not reachable, but makes PyCharm happy
+    elif (installed := installer.installed_version) is not None and _version_key(target) <= _version_key(installed):
+        msg = f'The staged version={target} is not newer than the installed version={installed}'
+        module.exit_json(changed=False, msg=msg, **meta)
+        return  # Not reachable, but makes PyCharm happy
+
+    if not module.check_mode:
+        previous_dir = installer.active_dir
+        installer.activate(version_dir)
+        if (keep := installer.saved_keep_previous) is not None:
+            installer.prune_previous(keep, protect=previous_dir)
+        meta['timings'] = installer.timer.results()
+    module.exit_json(changed=True, msg=f'Activated Plex Media Server version={target}', **meta)
 
 
 class OsRelease:
@@ -182,7 +427,187 @@ class PlexInstallError(Exception):
     pass
 
 
+class ReleaseCache:
+    """
+    Persistent index of the release files in the release cache directory, keyed by (version, build, distro).
+
+    Files that were already present in the directory when the index was first created are indexed under their file
+    name, and are assigned a version the first time that they are matched via :meth:`.find`.
+
+    The cache directory may be shared by concurrent runs, so the index is locked and re-read before each update.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = None, keep_versions: int = None):
+        self.path = path
+        self.index_path = path.joinpath('index.json')
+        self.max_bytes = max_bytes
+        self.keep_versions = keep_versions
+        self._updating_index = False
+
+    @cached_property
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with self.index_path.open('r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+
+        entries = {}
+        for path in self.path.iterdir():
+            if path.is_file() and not path.name.startswith('.') and path.suffix not in ('.part', '.json'):
+                stat = path.stat()
+                entries[path.name] = {
+                    'version': None, 'build': None, 'distro': None, 'file': path.name, 'size': stat.st_size,
+                    'checksum': None, 'last_used': stat.st_mtime,
+                }
+        return entries
+
+    @classmethod
+    def _key(cls, version: str, build: str, distro: str) -> str:
+        return f'{version}|{build}|{distro}'
+
+    @contextmanager
+    def _update(self) -> Iterator[None]:
+        """Lock the index and reload it so changes made by other processes are not lost, then save it when done"""
+        if self._updating_index:
+            yield
+            return
+
+        with _locked(self.path.joinpath('.index.lock')):
+            self._updating_index = True
+            try:
+                self.__dict__.pop('entries', None)
+                yield
+                self.save()
+            finally:
+                self._updating_index = False
+
+    def get(self, version: str, build: str, distro: str) -> Optional[Path]:
+        key = self._key(version, build, distro)
+        if key not in self.entries:
+            return None
+
+        with self._update():
+            try:
+                entry = self.entries[key]
+            except KeyError:
+                return None
+
+            path = self.path.joinpath(entry['file'])
+            if not path.exists():
+                del self.entries[key]
+                return None
+
+            entry['last_used'] = time.time()
+            return path
+
+    def find(self, version: str, build: str, distro: str) -> Optional[Path]:
+        """
+        Find the cached file for the given version.  Falls back to matching the version against the names of files
+        that were cached before the index existed, in which case the matching file is indexed under the given version.
+        """
+        if path := self.get(version, build, distro):
+            return path
+
+        version_pat = re.compile(r'(?:^|[-_]){}(?:$|[-_.])'.format(re.escape(version)))
+        with self._update():
+            matches = [
+                key for key, entry in self.entries.items() if entry['version'] is None and version_pat.search(key)
+            ]
+            if len(matches) != 1:
+                return None
+
+            entry = self.entries.pop(matches[0])
+            return self.add(version, build, distro, self.path.joinpath(entry['file']), entry['checksum'])
+
+    def add(self, version: str, build: str, distro: str, path: Path, checksum: Optional[str]) -> Path:
+        with self._update():
+            self.entries[self._key(version, build, distro)] = {
+                'version': version, 'build': build, 'distro': distro, 'file': path.name, 'size': path.stat().st_size,
+                'checksum': checksum, 'last_used': time.time(),
+            }
+        return path
+
+    def peek(self, version: str, build: str, distro: str) -> Optional[Path]:
+        """Find the cached file for the given version without updating the index"""
+        try:
+            path = self.path.joinpath(self.entries[self._key(version, build, distro)]['file'])
+        except KeyError:
+            return None
+        return path if path.exists() else None
+
+    def checksum(self, version: str, build: str, distro: str) -> Optional[str]:
+        try:
+            return self.entries[self._key(version, build, distro)]['checksum']
+        except KeyError:
+            return None
+
+    def evict(self, keep: Path = None) -> List[Path]:
+        """
+        Remove the least recently used files until the configured size and count limits are satisfied.
+
+        :param keep: A path that should not be removed, even if it is the least recently used file
+        :return: The paths that were removed
+        """
+        if self.keep_versions is None and self.max_bytes is None:
+            return []
+
+        evicted = []
+        with self._update():
+            count = len(self.entries)
+            total = sum(entry['size'] for entry in self.entries.values())
+            for key, entry in sorted(self.entries.items(), key=lambda kv: kv[1]['last_used']):
+                over_count = self.keep_versions is not None and count > self.keep_versions
+                over_size = self.max_bytes is not None and total > self.max_bytes
+                if not over_count and not over_size:
+                    break
+
+                path = self.path.joinpath(entry['file'])
+                if path == keep:
+                    continue
+
+                _remove_release(path)
+                del self.entries[key]
+                evicted.append(path)
+                count -= 1
+                total -= entry['size']
+
+        return evicted
+
+    def save(self):
+        _atomic_write_json(self.index_path, self.entries)
+
+
+class PhaseTimer:
+    """Records the wall time spent in each phase of an install, and the number of bytes transferred in each phase."""
+
+    def __init__(self):
+        self.times = {}
+        self.bytes = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0) + time.perf_counter() - start
+
+    def add_bytes(self, name: str, count: int):
+        self.bytes[name] = self.bytes.get(name, 0) + count
+
+    def results(self) -> Dict[str, Union[int, float]]:
+        results = {name: round(elapsed, 3) for name, elapsed in self.times.items()}
+        for name, count in self.bytes.items():
+            results[f'{name}_bytes'] = count
+            if elapsed := self.times.get(name):
+                results[f'{name}_mb_per_sec'] = round(count / elapsed / 1_000_000, 2)
+        return results
+
+
 class PlexInstaller:
+    feed_url = FEED_URL
+
     def __init__(
         self,
         x_plex_token: str,
@@ -193,17 +618,43 @@ class PlexInstaller:
         distro: str = None,
         cache_dir: Union[str, Path] = None,
         version: str = 'latest',
+        download_connections: int = 4,
+        cache_max_bytes: int = None,
+        cache_keep_versions: int = None,
+        keep_previous: int = 0,
+        feed_cache_ttl: int = 600,
+        feed_stale_while_revalidate: bool = False,
+        streaming_install: bool = False,
+        extract_backend: str = 'auto',
+        delta_install: bool = False,
+        download_base_url: str = None,
+        check_mode: bool = False,
     ):
         self.x_plex_token = x_plex_token
         self.verify_checksum = verify_checksum
         self.version = version or 'latest'
+        self.download_connections = max(download_connections, 1)
+        self.keep_previous = max(keep_previous, 0)
+        self.feed_cache_ttl = feed_cache_ttl
+        self.feed_stale_while_revalidate = feed_stale_while_revalidate
+        self.streaming_install = streaming_install
+        self.use_parallel_decompressor = extract_backend == 'auto'
+        self.extract_backend = None  # The backend that was actually used, if a release was extracted
+        self.delta_install = delta_install
+        self.delta_stats = None
+        self.download_base_url = download_base_url
+        self.check_mode = check_mode
+        self.timer = PhaseTimer()
 
         self.install_dir = Path(install_dir or INSTALL_PATH_DEFAULT)
         self.version_path = self.install_dir.joinpath('__version__.txt')
+        self.versions_dir = self.install_dir.with_name(f'{self.install_dir.name}.versions')
+        self.staged_path = self.versions_dir.joinpath('.staged')
+        self.keep_previous_path = self.versions_dir.joinpath('.keep_previous')
         self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
         self.release_cache_dir = self.cache_dir.joinpath('releases')
-        if not self.release_cache_dir.exists():
-            self.release_cache_dir.mkdir(parents=True)
+        self.release_cache_dir.mkdir(parents=True, exist_ok=True)
+        self.release_cache = ReleaseCache(self.release_cache_dir, cache_max_bytes, cache_keep_versions)
 
         uname = platform.uname()
         self.system = system or uname.system.lower()
@@ -222,36 +673,302 @@ class PlexInstaller:
             return True, f'Found existing={self.installed_version} installed, but the target={self.target_version}'
 
     def install(self):
-        path = self.get_release()
-        with TemporaryDirectory() as tmp_dir:
-            tmp_dir = Path(tmp_dir)
-            tar_file = TarFile.open(path)
-            tar_file.extractall(tmp_dir)
-
-            extracted_dir = next((p for p in tmp_dir.iterdir() if p.is_dir()))
-            version_path = extracted_dir.joinpath('__version__.txt')
-            version_path.write_text(f'{self.target_version}\n', encoding='utf-8')
+        # Re-use a kept version when rolling forward after a rollback, or when installing a version that was staged
+        version_dir = self.kept_dir(self.target_version) or self._extract_target()
+        self._save_keep_previous()
+        self.activate(version_dir)
+        self.prune_previous(self.keep_previous)
+
+    def stage(self) -> Path:
+        """
+        Extract the target version so that it is ready to be activated later, without changing the active version.  A
+        kept previous version is re-used instead of being extracted again.
+
+        The marker records whether the staged directory was freshly extracted.  If a different version was staged
+        before, then its directory is only removed here if it was freshly extracted, since it was never active.
+        Otherwise, it is a previously active version that is subject to the normal retention rules.
+        """
+        old_staged_dir, old_staged_fresh = self.staged_dir, self._staged_fresh
+        if (version_dir := self.kept_dir(self.target_version)) is not None:
+            fresh = old_staged_fresh if version_dir == old_staged_dir else False
+        else:
+            version_dir, fresh = self._extract_target(), True
+
+        self._save_keep_previous()
+        tmp_path = _unique_path(self.versions_dir, f'{self.staged_path.name}.tmp')
+        tmp_path.write_text(f'{version_dir.name}\n{"fresh" if fresh else "kept"}\n', encoding='utf-8')
+        tmp_path.replace(self.staged_path)
+        if old_staged_dir is not None and old_staged_dir != version_dir and old_staged_fresh:
+            self._remove_version_dirs(old_staged_dir)
+        return version_dir
+
+    def _extract_target(self) -> Path:
+        if self.streaming_install and not self.cached_release_ok:
+            with self._release_lock() as cached:
+                if not cached:
+                    return self._stream_install()
+        return self._extract_release(self.get_release())
+
+    def _stream_install(self) -> Path:
+        """
+        Extract the target release while it is being downloaded.  The download is written to the release cache and
+        hashed in a background thread while the main thread decompresses and extracts it, so network, CPU, and disk
+        work overlap.  The extracted tree is only moved out of staging after the download has been verified.
+        """
+        path = self.release_path
+        part_path = path.with_name(f'{path.name}.part')
+        state_path = part_path.with_name(f'{part_path.name}.json')
+        if state_path.exists():  # Progress from an interrupted ranged download would not match the new .part file
+            state_path.unlink()
+
+        reader = TeeReader(stream_url(self.release_url), part_path)
+        try:
+            with self.timer.phase('download'):
+                return self._extract_release(reader, partial(self._finish_stream, reader, part_path, path))
+        finally:
+            reader.close()
+            self.timer.add_bytes('download', reader.size)
+
+    def _finish_stream(self, reader: 'TeeReader', part_path: Path, path: Path):
+        checksum = reader.finish()
+        if self.verify_checksum and not self.release_info['checksum'] == checksum:
+            part_path.unlink()
+            raise PlexInstallError(f'checksum mismatch - expected={self.release_info["checksum"]} found={checksum}')
+
+        part_path.replace(path)
+        _write_integrity_sidecar(path, checksum)
+        self._cache_release(path, checksum if self.verify_checksum else None)
+        with self.timer.phase('cleanup'):
+            self.release_cache.evict(keep=path)
+
+    def activate(self, version_dir: Path):
+        """
+        Make the given version directory the active install.  No previously active versions are removed.  Any staged
+        version is no longer considered to be staged, so it will not be activated later, and it is subject to the
+        normal retention rules for previous versions.
+        """
+        self._replace_install_dir(version_dir, self.install_dir)
+        self.__dict__['installed_version'] = _read_version(version_dir)
+        if self.staged_path.exists():
+            self.staged_path.unlink()
+
+    def prune_previous(self, keep: int, protect: Path = None):
+        """
+        Remove the least recently active previous versions beyond the given number to keep, in the background.
+
+        :param keep: The number of previously active versions to keep
+        :param protect: A version directory that should not be removed, even if it is beyond the number to keep
+        """
+        with self.timer.phase('cleanup'):
+            if old_dirs := [p for p in self.previous_dirs()[keep:] if p != protect]:
+                self._remove_version_dirs(*old_dirs)
+
+    def _remove_version_dirs(self, *version_dirs: Path):
+        """Remove the given version directories in the background"""
+        # Renamed first, so a directory that is still being removed is never mistaken for a kept version
+        _remove_in_background(*(p.rename(_unique_path(self.versions_dir, f'.removing-{p.name}')) for p in version_dirs))
+
+    # region Installed Versions
+
+    @property
+    def active_dir(self) -> Optional[Path]:
+        return self.install_dir.resolve() if self.install_dir.is_symlink() else None
+
+    @property
+    def staged_dir(self) -> Optional[Path]:
+        """The version directory that was extracted via :meth:`.stage` and has not been activated yet, if any"""
+        try:
+            name = self.staged_path.read_text('utf-8').partition('\n')[0].strip()
+        except FileNotFoundError:
+            return None
+        version_dir = self.versions_dir.joinpath(name)
+        return version_dir if name and version_dir.joinpath('__version__.txt').exists() else None
 
-            self._replace_install_dir(extracted_dir, self.install_dir)
+    @property
+    def _staged_fresh(self) -> bool:
+        """Whether the staged version was freshly extracted, rather than being a kept version that was active before"""
+        try:
+            return self.staged_path.read_text('utf-8').splitlines()[1:2] == ['fresh']
+        except FileNotFoundError:
+            return False
+
+    def previous_dirs(self) -> List[Path]:
+        """The inactive version directories in :attr:`.versions_dir`, most recently active first"""
+        if not self.versions_dir.exists():
+            return []
+
+        active_dir, staged_dir = self.active_dir, self.staged_dir
+        dirs = [
+            p for p in self.versions_dir.iterdir()
+            if p.is_dir() and not p.name.startswith('.') and p.resolve() != active_dir and p != staged_dir
+        ]
+        return sorted(dirs, key=lambda p: p.stat().st_mtime, reverse=True)
+
+    def kept_dir(self, version: str) -> Optional[Path]:
+        """The inactive directory in :attr:`.versions_dir` that contains the given version, if any"""
+        candidates = self.previous_dirs()
+        if (staged_dir := self.staged_dir) is not None:
+            candidates.append(staged_dir)
+        return next((p for p in candidates if _read_version(p) == version), None)
+
+    @property
+    def saved_keep_previous(self) -> Optional[int]:
+        """The value of ``keep_previous`` that was used by the last run that installed or staged a version"""
+        try:
+            return int(self.keep_previous_path.read_text('utf-8').strip())
+        except (FileNotFoundError, ValueError):
+            return None
 
-        self.install_dir.joinpath('Plex_Media_Server').symlink_to(self.install_dir.joinpath('Plex Media Server'))
-        self.__dict__['installed_version'] = self.target_version
+    def _save_keep_previous(self):
+        tmp_path = _unique_path(self.versions_dir, f'{self.keep_previous_path.name}.tmp')
+        tmp_path.write_text(f'{self.keep_previous}\n', encoding='utf-8')
+        tmp_path.replace(self.keep_previous_path)
 
-    def _replace_install_dir(self, extracted_dir: Path, install_dir: Path):
-        bkp_dir = None
-        if install_dir.exists():
-            bkp_dir = _unique_path(install_dir.parent, f'{install_dir.name}_bkp')
-            install_dir.rename(bkp_dir)
+    def rollback_dir(self) -> Path:
+        if self.version != 'latest':
+            version_dir = self.versions_dir.joinpath(self.version)
+            if not version_dir.joinpath('__version__.txt').exists():
+                raise PlexInstallError(f'Unable to find installed version={self.version} in {self.versions_dir}')
+            return version_dir
 
         try:
-            extracted_dir.replace(install_dir)
-        except Exception:
-            if bkp_dir is not None:
-                bkp_dir.rename(install_dir)
-            raise
+            return self.previous_dirs()[0]
+        except IndexError:
+            raise PlexInstallError(f'No previous versions were found in {self.versions_dir} to roll back to') from None
+
+    # endregion
+
+    def _extract_release(self, source: Union[Path, BinaryIO], finish: Callable[[], None] = None) -> Path:
+        """
+        Extract the given release into a new directory in :attr:`.versions_dir`.  Extraction happens in a staging
+        directory on the same filesystem, so the fully extracted tree can be moved into place with a rename.
 
-        if bkp_dir is not None:
-            shutil.rmtree(bkp_dir)
+        :param source: The path to a release archive, or a file-like object that provides a release archive stream
+        :param finish: A function to call after extraction is complete, before leaving the staging directory
+        """
+        self.versions_dir.mkdir(parents=True, exist_ok=True)
+        staging_dir = Path(mkdtemp(prefix='.staging-', dir=self.versions_dir))
+        try:
+            with self.timer.phase('extract'), self._open_release(source) as tar_file:
+                if self.delta_install and (reference_dir := self.active_dir) is not None:
+                    self._delta_extract(tar_file, staging_dir, reference_dir)
+                else:
+                    tar_file.extractall(staging_dir)
+            if finish is not None:
+                finish()
+
+            extracted_dir = next((p for p in staging_dir.iterdir() if p.is_dir()))
+            version_path = extracted_dir.joinpath('__version__.txt')
+            version_path.write_text(f'{self.target_version}\n', encoding='utf-8')
+            extracted_dir.joinpath('Plex_Media_Server').symlink_to('Plex Media Server')
+
+            version_dir = _unique_path(self.versions_dir, self.target_version)
+            extracted_dir.rename(version_dir)
+        finally:
+            shutil.rmtree(staging_dir)
+
+        return version_dir
+
+    def _delta_extract(self, tar_file: TarFile, staging_dir: Path, reference_dir: Path):
+        """
+        Extract the given archive, but hard link regular files that are identical to the file at the same relative path
+        in the reference tree instead of writing them again.  Archive member paths are compared with reference paths
+        after stripping the archive's top-level directory.
+        """
+        check_owner = hasattr(os, 'geteuid') and os.geteuid() == 0  # tarfile only sets ownership when running as root
+        linked = written = 0
+        for member in tar_file:
+            ref_path = ref_stat = None
+            if member.isfile() and '/' in member.name:
+                ref_path = reference_dir.joinpath(member.name.split('/', 1)[1])
+                try:
+                    ref_stat = ref_path.lstat()
+                except FileNotFoundError:
+                    pass
+
+            if ref_stat is None or not _same_file_attrs(member, ref_stat, check_owner):
+                tar_file.extract(member, staging_dir)
+                written += member.isfile()
+            elif _link_if_unchanged(tar_file, member, ref_path, staging_dir.joinpath(member.name)):
+                linked += 1
+            else:
+                written += 1
+
+        self.delta_stats = {'linked': linked, 'written': written}
+
+    @contextmanager
+    def _open_release(self, source: Union[Path, BinaryIO]) -> Iterator[TarFile]:
+        """
+        Open the given release archive or archive stream for extraction.  If a multi-threaded decompressor is available
+        for the archive type, then the archive is decompressed in a subprocess, and Python only needs to handle the
+        uncompressed tar stream.
+        """
+        cmd = self._parallel_decompressor()
+        if cmd is None:
+            self.extract_backend = 'python'
+            if isinstance(source, Path):
+                tar_file = TarFile.open(source)
+            else:
+                tar_file = TarFile.open(fileobj=source, mode='r|*')
+            with tar_file:
+                yield tar_file
+            return
+
+        self.extract_backend = cmd[0]
+        if isinstance(source, Path):
+            proc, feeder = Popen([*cmd, source.as_posix()], stdout=PIPE), None
+        else:
+            proc = Popen(cmd, stdin=PIPE, stdout=PIPE)
+            feeder = _StdinFeeder(source, proc.stdin)
+
+        with proc:
+            with TarFile.open(fileobj=proc.stdout, mode='r|') as tar_file:
+                yield tar_file
+            while proc.stdout.read(DOWNLOAD_CHUNK_SIZE):  # Consume any trailing padding so the process can exit
+                pass
+            if feeder is not None:
+                feeder.join()
+
+        if proc.returncode:
+            raise PlexInstallError(f'Error decompressing release archive - {cmd[0]} exited with code={proc.returncode}')
+
+    def _parallel_decompressor(self) -> Optional[Tuple[str, ...]]:
+        if not self.use_parallel_decompressor:
+            return None
+        for cmd in PARALLEL_DECOMPRESSORS.get(self.release_path.suffix, ()):
+            if shutil.which(cmd[0]):
+                return cmd
+        return None
+
+    def _replace_install_dir(self, version_dir: Path, install_dir: Path):
+        """Atomically re-point the ``install_dir`` symlink at the given version directory"""
+        with self.timer.phase('swap'):
+            legacy_dir = None
+            if not install_dir.is_symlink() and install_dir.exists():
+                # A plain directory from before versioned installs were used
+                legacy_dir = _unique_path(self.versions_dir, self.installed_version or 'legacy')
+                install_dir.rename(legacy_dir)
+
+            tmp_link = _unique_path(install_dir.parent, f'.{install_dir.name}.tmp')
+            try:
+                tmp_link.symlink_to(os.path.relpath(version_dir, install_dir.parent))
+                tmp_link.replace(install_dir)
+            except Exception:
+                if tmp_link.is_symlink():
+                    tmp_link.unlink()
+                if legacy_dir is not None:
+                    legacy_dir.rename(install_dir)
+                raise
+
+            os.utime(version_dir)  # The mtime is used to determine the order in which versions were active
+
+    def log_timings(self, meta: Dict[str, Any], error: str = None):
+        """Append the timings for this run to a JSON lines log in the cache directory"""
+        entry = {'time': time.time(), 'host': platform.node(), **meta}
+        if error:
+            entry['error'] = error
+        with self.cache_dir.joinpath('timings.jsonl').open('a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
 
     # region Version Info
 
@@ -276,20 +993,67 @@ class PlexInstaller:
 
     @cached_property
     def full_downloads_info(self) -> Dict[str, Any]:
+        with self.timer.phase('feed_fetch'):
+            return self._load_downloads_info()
+
+    def _load_downloads_info(self) -> Dict[str, Any]:
         cache_path = self.cache_dir.joinpath('downloads_info.json')
         if cache_path.exists():
             age = time.time() - cache_path.stat().st_mtime
-            if age < 600:  # 10 minutes
+            if age < self.feed_cache_ttl or self.feed_stale_while_revalidate:
+                with cache_path.open('r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if age >= self.feed_cache_ttl and not self.check_mode:
+                    self._refresh_downloads_info_in_background()
+                return data
+
+        with _locked(self.cache_dir.joinpath('.downloads_info.lock')):
+            # Another process may have refreshed the feed while this one was waiting for the lock
+            if cache_path.exists() and time.time() - cache_path.stat().st_mtime < self.feed_cache_ttl:
                 with cache_path.open('r', encoding='utf-8') as f:
                     return json.load(f)
+            return self._refresh_downloads_info()
+
+    def _refresh_downloads_info(self) -> Dict[str, Any]:
+        """Fetch the downloads feed, if it changed.  The caller must hold the ``.downloads_info.lock`` lock."""
+        cache_path = self.cache_dir.joinpath('downloads_info.json')
+        validators_path = self.cache_dir.joinpath('downloads_info.validators.json')
+        headers = {}
+        if cache_path.exists() and validators_path.exists():
+            with validators_path.open('r', encoding='utf-8') as f:
+                validators = json.load(f)
+            if etag := validators.get('etag'):
+                headers['If-None-Match'] = etag
+            if last_modified := validators.get('last-modified'):
+                headers['If-Modified-Since'] = last_modified
 
         params = {'channel': 'plexpass', 'X-Plex-Token': self.x_plex_token}
-        data = get_json(f'https://plex.tv/api/downloads/5.json?{urlencode(params)}')
+        status, resp_headers, data = get_json(f'{self.feed_url}?{urlencode(params)}', headers)
+        if status == 304:
+            os.utime(cache_path)
+            with cache_path.open('r', encoding='utf-8') as f:
+                return json.load(f)
+
+        _atomic_write_json(cache_path, data)
+        _atomic_write_json(validators_path, {k: resp_headers.get(k) for k in ('etag', 'last-modified')})
+        return data
 
-        with cache_path.open('w', encoding='utf-8') as f:
-            json.dump(data, f)
+    def _refresh_downloads_info_in_background(self):
+        """Refresh the cached downloads feed in a forked process that will continue after this module exits."""
+        if os.fork():
+            return
 
-        return data
+        try:
+            os.setsid()
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in range(3):  # Ansible waits for stdout/stderr to be closed before the module is considered done
+                os.dup2(devnull, fd)
+            # If another process is already refreshing the feed, then there is nothing to do
+            with _locked(self.cache_dir.joinpath('.downloads_info.lock'), blocking=False) as acquired:
+                if acquired:
+                    self._refresh_downloads_info()
+        finally:
+            os._exit(0)
 
     @cached_property
     def system_release_info(self) -> Dict[str, Any]:
@@ -320,34 +1084,203 @@ class PlexInstaller:
             spec += f' and distro={self.distro}'
         raise PlexInstallError(f'Unable to pick Plex release for {spec} from {filtered=}')
 
+    @cached_property
+    def release_url(self) -> str:
+        """The URL from which the target release should be downloaded, which may be in a local mirror"""
+        url = self.release_info['url']
+        if not self.download_base_url:
+            return url
+
+        mirror_url = urljoin(self.download_base_url.rstrip('/') + '/', urlsplit(url).path.lstrip('/'))
+        try:
+            get_headers(mirror_url)
+        except (HttpError, OSError):  # The mirror is unavailable or has not mirrored this release yet
+            return url
+        return mirror_url
+
     @cached_property
     def release_path(self) -> Path:
-        if self.version == 'latest':
+        distro = self.release_info['distro']
+        with self.timer.phase('cache_lookup'):
+            path = self.release_cache.find(self.target_version, self.build, distro)
+        if path:
+            return path
+        elif self.version == 'latest':
             return self.release_cache_dir.joinpath(self.release_info['url'].rsplit('/', 1)[-1])
 
-        for path in self.release_cache_dir.iterdir():
-            if self.version in path.name:
-                return path
-
         raise PlexInstallError(f'Unable to find cached version={self.version} in {self.release_cache_dir.as_posix()}')
 
+    def release_details(self) -> Dict[str, Any]:
+        """
+        Details about the target release, used by the action plugin to provide the release from the controller.  The
+        release cache is not modified, and cached files are not rehashed - a cached file is only reported as cached if
+        its integrity sidecar matches the expected checksum.
+        """
+        latest = self.version == 'latest'
+        distro = self.release_info['distro']
+        path = self.release_cache.peek(self.target_version, self.build, distro)
+        if path is None and latest:
+            path = self.release_cache_dir.joinpath(self.release_info['url'].rsplit('/', 1)[-1])
+
+        if path is None or not path.exists():
+            cached = False
+        elif not self.verify_checksum:
+            cached = True
+        else:
+            expected = self.release_info['checksum'] if latest else self.release_cache.checksum(
+                self.target_version, self.build, distro
+            )
+            checksum = _trusted_checksum(path)
+            cached = checksum is not None and (expected is None or checksum == expected)
+
+        return {
+            'version': self.target_version,
+            'url': self.release_url if latest else None,
+            'checksum': self.release_info['checksum'] if latest else None,
+            'path': path.as_posix() if path else None,
+            'cached': cached,
+        }
+
+    @contextmanager
+    def _release_lock(self) -> Iterator[bool]:
+        """
+        Hold an exclusive lock for downloading the target release into the release cache.  If another process was
+        downloading it while this one was waiting for the lock, then it is reused instead of being downloaded again.
+
+        :return: True if the target release was cached by the time that the lock was acquired, False otherwise
+        """
+        path = self.release_path
+        with _locked(path.with_name(f'.{path.name}.lock')):
+            self.__dict__.pop('cached_release_ok', None)
+            yield self.cached_release_ok
+
+    @cached_property
+    def cached_release_ok(self) -> bool:
+        """
+        Whether the target release is cached and intact.  The checksum recorded in a file's integrity sidecar is trusted
+        without reading the file again if the sidecar still matches the file's size, mtime, and inode.  Otherwise, the
+        file is fully rehashed.  A cached file for the latest version that does not match the expected checksum is
+        removed, so it will be downloaded again.
+        """
+        path = self.release_path
+        if not path.exists():
+            return False
+        elif not self.verify_checksum:
+            return True
+
+        if self.version == 'latest':
+            expected = self.release_info['checksum']
+        else:
+            expected = self.release_cache.checksum(self.target_version, self.build, self.release_info['distro'])
+
+        with self.timer.phase('checksum'):
+            if (checksum := _trusted_checksum(path)) is None:
+                checksum = _file_sha1(path)
+                if expected is None or checksum == expected:
+                    _write_integrity_sidecar(path, checksum)
+
+        if expected is None or checksum == expected:
+            return True
+        elif self.version != 'latest':
+            raise PlexInstallError(
+                f'Cached version={self.version} in {path.as_posix()} is corrupt - expected checksum={expected}'
+                f' found={checksum}'
+            )
+
+        _remove_release(path)
+        return False
+
     def get_release(self) -> Path:
-        if self.release_path.exists():
-            return self.release_path
-        return self.download_release(self.release_cache_dir)
+        path = self.release_path
+        if not self.cached_release_ok:
+            with self._release_lock() as cached:
+                if not cached:
+                    path = self.download_release(self.release_cache_dir)
+                    self._cache_release(path, self.release_info['checksum'] if self.verify_checksum else None)
+
+        if self.release_cache.get(self.target_version, self.build, self.release_info['distro']) is None:
+            self._cache_release(path, _trusted_checksum(path))
+
+        with self.timer.phase('cleanup'):
+            self.release_cache.evict(keep=path)
+        return path
+
+    def import_release(self, src_path: Path):
+        """
+        Add a release file that was transferred from the controller to the release cache, unless another process cached
+        the target release first.  The file is moved to a temp file in the release cache directory, verified, and then
+        renamed into place while holding the release lock, so concurrent runs that share the cache never see a partial
+        file, even if the file was transferred to a different filesystem.
+        """
+        path = self.release_path
+        with self._release_lock() as cached:
+            if cached:
+                return
+
+            fd, tmp_path = mkstemp(prefix=f'.{path.name}.', suffix='.part', dir=path.parent)
+            os.close(fd)
+            tmp_path = Path(tmp_path)
+            try:
+                with self.timer.phase('import'):
+                    shutil.move(src_path.as_posix(), tmp_path.as_posix())
+                    checksum = _file_sha1(tmp_path)
+                if self.verify_checksum and not (expected := self.release_info['checksum']) == checksum:
+                    msg = f'checksum mismatch in release from the controller - expected={expected} found={checksum}'
+                    raise PlexInstallError(msg)
+                tmp_path.chmod(0o644)
+                tmp_path.replace(path)
+            except BaseException:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+                raise
+
+            _write_integrity_sidecar(path, checksum)
+            self._cache_release(path, checksum if self.verify_checksum else None)
+            self.__dict__['cached_release_ok'] = True
+
+    def _cache_release(self, path: Path, checksum: Optional[str]):
+        self.release_cache.add(self.target_version, self.build, self.release_info['distro'], path, checksum)
 
     def download_release(self, dir_path: Path = None) -> Path:
         release_info = self.release_info
         dir_path = dir_path or self.release_cache_dir
         path = dir_path.joinpath(release_info['url'].rsplit('/', 1)[-1])
+        part_path = path.with_name(f'{path.name}.part')
+
+        with self.timer.phase('download'):
+            url = self.release_url
+            try:
+                headers = get_headers(url)
+            except HttpError:  # Some servers reject HEAD requests; a plain GET may still work
+                headers = {}
+            size = int(headers.get('content-length') or 0)
+            if size and headers.get('accept-ranges') == 'bytes':
+                download = RangedDownload(url, part_path, size, headers, self.download_connections, timer=self.timer)
+                checksum = download.download()
+                self.timer.add_bytes('download', download.downloaded)
+            else:
+                checksum = save_file(url, save_path=part_path)
+                self.timer.add_bytes('download', part_path.stat().st_size)
+
+        if self.verify_checksum and not release_info['checksum'] == checksum:
+            part_path.unlink()
+            raise PlexInstallError(f'checksum mismatch - expected={release_info["checksum"]} found={checksum}')
+
+        part_path.replace(path)
+        _write_integrity_sidecar(path, checksum)
+        return path
 
-        save_file(release_info['url'], save_path=path)
 
-        if self.verify_checksum:
-            checksum = hashlib.sha1(path.read_bytes()).hexdigest()
-            if not release_info['checksum'] == checksum:
-                raise PlexInstallError(f'checksum mismatch - expected={release_info["checksum"]} found={checksum}')
-        return path
+def _read_version(version_dir: Path) -> Optional[str]:
+    try:
+        return version_dir.joinpath('__version__.txt').read_text('utf-8').strip()
+    except FileNotFoundError:
+        return None
+
+
+def _version_key(version: str) -> Tuple[int, ...]:
+    """Sort key for Plex versions, e.g., ``1.32.5.7349-8f4248874``, based on the numeric parts before the hash"""
+    return tuple(int(part) for part in re.findall(r'\d+', version.split('-', 1)[0]))
 
 
 def _unique_path(parent: Path, name: str) -> Path:
@@ -360,84 +1293,661 @@ def _unique_path(parent: Path, name: str) -> Path:
     return path
 
 
-def _download_func(req_func, curl_func):
-    def download_func(url: str, *args, curl_args=(), **kwargs):
+# region Release Integrity
+
+def _integrity_sidecar_path(path: Path) -> Path:
+    return path.with_name(f'{path.name}.sha1.json')
+
+
+def _write_integrity_sidecar(path: Path, checksum: str):
+    """Record the checksum of the given file, along with the stat info that indicates whether it has been modified"""
+    stat_info = path.stat()
+    data = {'checksum': checksum, 'size': stat_info.st_size, 'mtime_ns': stat_info.st_mtime_ns, 'ino': stat_info.st_ino}
+    _atomic_write_json(_integrity_sidecar_path(path), data)
+
+
+def _trusted_checksum(path: Path) -> Optional[str]:
+    """The checksum from the given file's integrity sidecar, if the sidecar exists and still matches the file"""
+    try:
+        with _integrity_sidecar_path(path).open('r', encoding='utf-8') as f:
+            data = json.load(f)
+        stat_info = path.stat()
+    except (OSError, ValueError):
+        return None
+
+    if (data.get('size'), data.get('mtime_ns'), data.get('ino')) == (
+        stat_info.st_size, stat_info.st_mtime_ns, stat_info.st_ino
+    ):
+        return data.get('checksum')
+    return None
+
+
+def _file_sha1(path: Path) -> str:
+    with path.open('rb') as f:
+        return _hash_chunks(iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''))
+
+
+def _hash_chunks(chunks: Iterable[bytes]) -> str:
+    sha1 = hashlib.sha1()
+    for chunk in chunks:
+        sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _remove_release(path: Path):
+    for p in (path, _integrity_sidecar_path(path)):
+        if p.exists():
+            p.unlink()
+
+# endregion
+
+
+def _remove_in_background(*paths: Path):
+    """Remove the given paths in a detached process that will continue running after this module exits."""
+    cmd = ['rm', '-rf', *(path.as_posix() for path in paths)]
+    Popen(cmd, stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL, start_new_session=True)
+
+
+def _atomic_write_json(path: Path, data: Any):
+    # PIDs are not unique across jails that share the cache directory, so a unique temp file name is used
+    fd, tmp_path = mkstemp(prefix=f'.{path.name}.', suffix='.tmp', dir=path.parent)
+    try:
+        with open(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@contextmanager
+def _locked(lock_path: Path, blocking: bool = True) -> Iterator[bool]:
+    """
+    Hold an exclusive lock on the given lock file.  Locks are held per open file, so the same lock must not be acquired
+    again by the same process while it is held.
+
+    :param lock_path: The path of the lock file to use
+    :param blocking: Whether to wait for the lock to be released if another process holds it
+    :return: True if the lock was acquired, False if ``blocking`` is False and another process holds the lock
+    """
+    with lock_path.open('a') as f:
         try:
-            return req_func(url, *args, **kwargs)
-        except ImportError:
-            pass
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+
         try:
-            return curl_func(url, *args, args=curl_args, **kwargs)
-        except SubprocessError:
-            pass
-        missing_dependencies(url)
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
 
-    return download_func
 
+# region HTTP
 
-# region Get Json
+class HttpError(PlexInstallError):
+    pass
 
-def _get_json_via_requests(url: str):
-    import requests
 
-    with requests.Session() as session:
-        resp = session.get(url)
-        resp.raise_for_status()
-        return resp.json()
+class _HTTPSConnection(HTTPSConnection):
+    """HTTPS connection that resumes the previous TLS session with the same host when possible"""
 
+    def __init__(self, *args, tls_sessions: Dict[str, SSLSession], **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tls_sessions = tls_sessions
 
-def _get_json_via_curl(url: str, args=()):
-    stdout = check_output(['curl', url, *args])
-    return json.loads(stdout)
+    @property
+    def _server_hostname(self) -> str:
+        return self._tunnel_host or self.host
 
+    def connect(self):
+        HTTPConnection.connect(self)
+        session = self._tls_sessions.get(self._server_hostname)
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self._server_hostname, session=session)
 
-get_json = _download_func(_get_json_via_requests, _get_json_via_curl)
+    def save_session(self):
+        # With TLS 1.3, the session ticket is only received after the handshake, so this is done after a response
+        if self.sock is not None and self.sock.session is not None:
+            self._tls_sessions[self._server_hostname] = self.sock.session
+
+
+class HttpClient:
+    """
+    Minimal HTTP client that keeps idle connections open for reuse by later requests to the same host.  Connections are
+    only used by one request at a time, so the client may be shared by multiple threads.
+    """
+
+    def __init__(self, timeout: float = 60, max_redirects: int = 5):
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self._ssl_context = create_default_context()
+        self._tls_sessions = {}
+        self._idle = {}
+        self._lock = Lock()
+
+    def _new_connection(self, scheme: str, netloc: str) -> HTTPConnection:
+        proxy = getproxies().get(scheme)
+        if proxy and not proxy_bypass(netloc):
+            host = urlsplit(proxy).netloc
+        else:
+            host = netloc
+
+        if scheme == 'https':
+            conn = _HTTPSConnection(
+                host, timeout=self.timeout, context=self._ssl_context, tls_sessions=self._tls_sessions
+            )
+        else:
+            conn = HTTPConnection(host, timeout=self.timeout)
+        if host != netloc:
+            conn.set_tunnel(netloc)
+        return conn
+
+    def _acquire(self, scheme: str, netloc: str) -> Tuple[HTTPConnection, bool]:
+        with self._lock:
+            try:
+                return self._idle[(scheme, netloc)].pop(), True
+            except (KeyError, IndexError):
+                pass
+        return self._new_connection(scheme, netloc), False
+
+    def _release(self, scheme: str, netloc: str, conn: HTTPConnection):
+        if isinstance(conn, _HTTPSConnection):
+            conn.save_session()
+        with self._lock:
+            self._idle.setdefault((scheme, netloc), []).append(conn)
+
+    @contextmanager
+    def request(self, method: str, url: str, headers: Dict[str, str] = None) -> Iterator[HTTPResponse]:
+        """
+        Send a request, following redirects, and yield the final response.  The response's connection is returned to
+        the pool afterwards if the response was fully read and the server allows the connection to be kept alive.
+        """
+        for _ in range(self.max_redirects + 1):
+            scheme, netloc, path, query, _ = urlsplit(url)
+            path = f'{path or "/"}?{query}' if query else path or '/'
+            conn, resp = self._send(method, scheme, netloc, path, headers)
+            try:
+                if resp.status in (301, 302, 303, 307, 308) and (location := resp.getheader('Location')):
+                    resp.read()
+                    url = urljoin(url, location)
+                    continue
+
+                yield resp
+            except BaseException:
+                conn.close()
+                raise
+            finally:
+                if not resp.isclosed() or resp.will_close:
+                    conn.close()
+                elif conn.sock is not None:
+                    self._release(scheme, netloc, conn)
+            return
+
+        raise HttpError(f'Too many redirects for {_redact(url)}')
+
+    def _send(
+        self, method: str, scheme: str, netloc: str, path: str, headers: Optional[Dict[str, str]]
+    ) -> Tuple[HTTPConnection, HTTPResponse]:
+        conn, reused = self._acquire(scheme, netloc)
+        try:
+            conn.request(method, path, headers=headers or {})
+            return conn, conn.getresponse()
+        except (OSError, HTTPException) as e:
+            conn.close()
+            if reused:  # The server may have closed the idle connection
+                return self._send(method, scheme, netloc, path, headers)
+            raise HttpError(f'Error requesting {scheme}://{netloc}{_redact(path)}: {e}') from e
+
+
+HTTP_CLIENT = HttpClient()
 
-# endregion
 
+def _redact(url: str) -> str:
+    """Remove the query string from the given URL, since it may contain the X-Plex-Token"""
+    return url.split('?', 1)[0]
 
-# region Get File
 
-def _save_file_via_requests(url: str, save_path: Path):
-    import requests
+def _raise_for_status(resp: HTTPResponse, url: str):
+    if resp.status >= 400:
+        raise HttpError(f'Error requesting {_redact(url)}: {resp.status} {resp.reason}')
 
-    with save_path.open('wb') as f, requests.Session() as session:
-        resp = session.get(url)
-        resp.raise_for_status()
-        f.write(resp.content)
 
+def _iter_chunks(resp: HTTPResponse) -> Iterator[bytes]:
+    return iter(lambda: resp.read(DOWNLOAD_CHUNK_SIZE), b'')
+
+
+def get_json(url: str, headers: Dict[str, str] = None) -> Tuple[int, Dict[str, str], Any]:
+    """
+    :param url: The URL to request
+    :param headers: Additional request headers, such as ``If-None-Match`` for a conditional request
+    :return: Tuple of (status code, lower-case response headers, parsed JSON data or None if the status was 304)
+    """
+    with HTTP_CLIENT.request('GET', url, headers) as resp:
+        _raise_for_status(resp, url)
+        data = resp.read()
+        resp_headers = {key.lower(): val for key, val in resp.getheaders()}
+        return resp.status, resp_headers, None if resp.status == 304 else json.loads(data)
 
-def _save_file_via_curl(url: str, save_path: Path, args=()):
-    check_call(['curl', url, '-o', save_path.as_posix(), *args])
 
+def get_headers(url: str) -> Dict[str, str]:
+    with HTTP_CLIENT.request('HEAD', url) as resp:
+        _raise_for_status(resp, url)
+        resp.read()
+        return {key.lower(): val for key, val in resp.getheaders()}
 
-save_file = _download_func(_save_file_via_requests, _save_file_via_curl)
+
+def _write_chunks(chunks: Iterable[bytes], f: BinaryIO) -> str:
+    """Write the given chunks to the given file, returning the sha1 hex digest of the written content."""
+    sha1 = hashlib.sha1()
+    for chunk in chunks:
+        f.write(chunk)
+        sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def save_file(url: str, save_path: Path) -> str:
+    with save_path.open('wb') as f, HTTP_CLIENT.request('GET', url) as resp:
+        _raise_for_status(resp, url)
+        return _write_chunks(_iter_chunks(resp), f)
+
+
+def _write_range(chunks: Iterable[bytes], save_path: Path, start: int, end: int):
+    expected = end - start + 1
+    written = 0
+    with save_path.open('r+b') as f:
+        f.seek(start)
+        for chunk in chunks:
+            chunk = chunk[:expected - written]
+            f.write(chunk)
+            written += len(chunk)
+            if written == expected:
+                break
+
+    if written != expected:
+        raise PlexInstallError(f'Incomplete range download for bytes={start}-{end} - received {written} bytes')
+
+
+def save_range(url: str, save_path: Path, start: int, end: int):
+    with HTTP_CLIENT.request('GET', url, {'Range': f'bytes={start}-{end}'}) as resp:
+        _raise_for_status(resp, url)
+        if resp.status != 206:
+            raise HttpError(f'Range request for bytes={start}-{end} was ignored by the server')
+        _write_range(_iter_chunks(resp), save_path, start, end)
+
+
+def stream_url(url: str) -> Iterator[bytes]:
+    with HTTP_CLIENT.request('GET', url) as resp:
+        _raise_for_status(resp, url)
+        yield from _iter_chunks(resp)
 
 # endregion
 
 
-def missing_dependencies(url: str):
-    import platform
-    from distutils.spawn import find_executable
+# region Stream File
+
+class TeeReader:
+    """
+    Read-only file-like object that provides the given stream of chunks, while a background thread consumes the stream,
+    writes each chunk to ``save_path``, and updates the checksum.  Up to ``max_chunks`` chunks are buffered, so the
+    network does not need to wait for the consumer unless it falls behind.
+    """
 
-    msg_parts = [
-        f'Unable to download {url} due to missing install time dependencies.',
-        'One of the following is required:',
-        '  - `pkg install curl`'
-    ]
-    if find_executable('pip') is None:
-        if platform.uname().system.lower() == 'freebsd':
-            py_ver = ''.join(platform.python_version_tuple()[:2])
-            cmd = f'pkg install py{py_ver}-pip'
+    def __init__(self, chunks: Iterable[bytes], save_path: Path, max_chunks: int = 16):
+        self.sha1 = hashlib.sha1()
+        self.size = 0
+        self._queue = Queue(max_chunks)
+        self._closed = Event()
+        self._chunk = b''
+        self._pos = 0
+        self._eof = False
+        self._error = None
+        self._thread = Thread(target=self._produce, args=(chunks, save_path), daemon=True)
+        self._thread.start()
+
+    def _produce(self, chunks: Iterable[bytes], save_path: Path):
+        try:
+            with save_path.open('wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    self.sha1.update(chunk)
+                    self.size += len(chunk)
+                    if not self._put(chunk):
+                        return
+        except BaseException as e:
+            self._put(e)
         else:
-            cmd = 'apt install python3-pip'
-        extra = f' (you may need to run `{cmd}` first)'
-    else:
-        extra = ''
+            self._put(None)
+
+    def _put(self, item: Union[bytes, BaseException, None]) -> bool:
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+            except Full:
+                pass
+            else:
+                return True
+        return False
+
+    def read(self, size: int = -1) -> bytes:
+        parts = []
+        while size:
+            if self._pos >= len(self._chunk):
+                if self._error is not None:
+                    raise self._error
+                elif self._eof:
+                    break
+                item = self._queue.get()
+                if item is None:
+                    self._eof = True
+                    break
+                elif isinstance(item, BaseException):
+                    self._error = item
+                    raise item
+                self._chunk, self._pos = item, 0
+
+            end = len(self._chunk) if size < 0 else self._pos + size
+            part = self._chunk[self._pos:end]
+            self._pos += len(part)
+            parts.append(part)
+            if size > 0:
+                size -= len(part)
+
+        return b''.join(parts)
+
+    def finish(self) -> str:
+        """Consume the rest of the stream, wait for it to be written, and return the sha1 hex digest of its content"""
+        while self.read(DOWNLOAD_CHUNK_SIZE):
+            pass
+        self._thread.join()
+        return self.sha1.hexdigest()
+
+    def close(self):
+        """Stop the background thread if the stream was not consumed, e.g., due to an extraction error"""
+        self._closed.set()
+
+# endregion
+
+
+# region Extraction
+
+def _same_file_attrs(member: TarInfo, ref_stat: os.stat_result, check_owner: bool) -> bool:
+    if not stat.S_ISREG(ref_stat.st_mode) or member.size != ref_stat.st_size:
+        return False
+    elif member.mode & 0o7777 != stat.S_IMODE(ref_stat.st_mode):
+        return False
+    return not check_owner or (member.uid == ref_stat.st_uid and member.gid == ref_stat.st_gid)
+
+
+def _link_if_unchanged(tar_file: TarFile, member: TarInfo, ref_path: Path, path: Path) -> bool:
+    """
+    Compare the content of the given archive member with the reference file as it is read from the archive.  If they
+    are identical, then ``path`` is created as a hard link to the reference file.  Otherwise, the reference file's
+    matching prefix and the rest of the member's content are written to ``path``.
+
+    :return: True if a hard link was created, False if the member's content was written
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    src = tar_file.extractfile(member)
+    with ref_path.open('rb') as ref:
+        offset = 0
+        while chunk := src.read(DOWNLOAD_CHUNK_SIZE):
+            if chunk != ref.read(len(chunk)):
+                break
+            offset += len(chunk)
+        else:
+            os.link(ref_path, path)
+            return True
+
+        ref.seek(0)
+        with path.open('wb') as f:
+            while offset:  # Copy the matching prefix, which was already consumed from the archive stream
+                data = ref.read(min(DOWNLOAD_CHUNK_SIZE, offset))
+                f.write(data)
+                offset -= len(data)
+            f.write(chunk)
+            shutil.copyfileobj(src, f, DOWNLOAD_CHUNK_SIZE)
+
+    path_str = path.as_posix()
+    tar_file.chown(member, path_str, False)
+    tar_file.chmod(member, path_str)
+    tar_file.utime(member, path_str)
+    return False
+
+
+class _StdinFeeder(Thread):
+    """Copies the given stream to a subprocess's stdin in the background, then closes it"""
+
+    def __init__(self, source: BinaryIO, stdin: BinaryIO):
+        super().__init__(daemon=True)
+        self.source = source
+        self.stdin = stdin
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            with self.stdin:
+                for chunk in iter(lambda: self.source.read(DOWNLOAD_CHUNK_SIZE), b''):
+                    self.stdin.write(chunk)
+        except (OSError, ValueError):  # The process exited, or stdin was closed after an extraction error
+            pass
+        except BaseException as e:
+            self.error = e
+
+    def join(self, timeout: float = None):
+        super().join(timeout)
+        if self.error is not None:
+            raise self.error
+
+# endregion
 
-    msg_parts.append(f'  - `pip install requests`{extra}')
-    raise RuntimeError('\n'.join(msg_parts))
+
+# region Ranged Download
+
+class RangedDownload:
+    """
+    Downloads a file in fixed-size segments via HTTP Range requests, using multiple connections in parallel.
+
+    Progress is tracked in a ``.json`` file next to the partial file, so an interrupted download can be resumed by only
+    fetching the segments that had not been completed yet.  The file is hashed in order as contiguous segments complete.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        part_path: Path,
+        size: int,
+        headers: Dict[str, str],
+        connections: int = 4,
+        segment_size: int = RANGE_SEGMENT_SIZE,
+        timer: PhaseTimer = None,
+    ):
+        self.url = url
+        self.part_path = part_path
+        self.state_path = part_path.with_name(f'{part_path.name}.json')
+        self.size = size
+        self.validator = headers.get('etag') or headers.get('last-modified')
+        self.connections = connections
+        self.segment_size = segment_size
+        self.timer = timer or PhaseTimer()
+        self.downloaded = 0  # The number of bytes downloaded by this instance, excluding previously completed segments
+
+    @cached_property
+    def segments(self) -> List[Tuple[int, int]]:
+        return [
+            (start, min(start + self.segment_size, self.size) - 1) for start in range(0, self.size, self.segment_size)
+        ]
+
+    def _new_state(self) -> Dict[str, Any]:
+        return {
+            'url': self.url,
+            'size': self.size,
+            'validator': self.validator,
+            'segment_size': self.segment_size,
+            'done': [],
+        }
+
+    def _load_state(self) -> Dict[str, Any]:
+        new_state = self._new_state()
+        if self.validator and self.state_path.exists() and self.part_path.exists():
+            try:
+                with self.state_path.open('r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except ValueError:
+                pass
+            else:
+                if all(state.get(key) == val for key, val in new_state.items() if key != 'done'):
+                    return state
+
+        with self.part_path.open('wb') as f:
+            f.truncate(self.size)
+        return new_state
+
+    def _save_state(self, state: Dict[str, Any]):
+        with self.state_path.open('w', encoding='utf-8') as f:
+            json.dump(state, f)
+
+    def download(self) -> str:
+        """Download any missing segments to :attr:`.part_path` and return the sha1 hex digest of the full file."""
+        state = self._load_state()
+        done = set(state['done'])
+        sha1 = hashlib.sha1()
+
+        with self.part_path.open('rb') as f, ThreadPoolExecutor(max_workers=self.connections) as executor:
+            futures = {
+                executor.submit(save_range, self.url, self.part_path, start, end): i
+                for i, (start, end) in enumerate(self.segments)
+                if i not in done
+            }
+            hashed = self._update_checksum(f, sha1, 0, done)
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    start, end = self.segments[futures[future]]
+                    self.downloaded += end - start + 1
+                    done.add(futures[future])
+                    state['done'] = sorted(done)
+                    self._save_state(state)
+                    hashed = self._update_checksum(f, sha1, hashed, done)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        self.state_path.unlink()
+        return sha1.hexdigest()
+
+    def _update_checksum(self, f: BinaryIO, sha1, hashed: int, done: Set[int]) -> int:
+        """
+        Add the completed segments that directly follow the first ``hashed`` segments to the checksum.  Returns the
+        new number of leading segments that have been hashed.
+        """
+        with self.timer.phase('checksum'):
+            while hashed in done:
+                start, end = self.segments[hashed]
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining:
+                    chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+                    sha1.update(chunk)
+                    remaining -= len(chunk)
+                hashed += 1
+
+        return hashed
+
+
+# endregion
+
+
+# region Mirror
+
+
+def mirror(argv: List[str]) -> int:
+    parser = ArgumentParser(
+        prog='plex.py mirror', description='Download Plex releases into a directory with the same layout as plex.tv'
+    )
+    parser.add_argument('--token', '-t', help='The X-Plex-Token to use (default: $X_PLEX_TOKEN)')
+    parser.add_argument('--dest', '-d', required=True, help='The directory in which releases should be saved')
+    parser.add_argument(
+        '--release', '-r', dest='specs', action='append', required=True, metavar='SYSTEM[:BUILD[:DISTRO]]',
+        help='A release to mirror, e.g., freebsd:freebsd-x86_64 (may be specified multiple times)',
+    )
+    parser.add_argument('--workers', '-w', type=int, default=4, help='The number of releases to download in parallel')
+    parser.add_argument('--feed-url', default=FEED_URL, help='The downloads feed URL (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    if not (token := args.token or os.environ.get('X_PLEX_TOKEN')):
+        parser.error('--token or $X_PLEX_TOKEN is required')
+
+    dest_dir = Path(args.dest)
+    feed = get_json(f'{args.feed_url}?{urlencode({"channel": "plexpass", "X-Plex-Token": token})}')[2]
+    releases = _releases_to_mirror(feed, [spec.split(':') for spec in args.specs])
+    if not releases:
+        print(f'No releases matched {args.specs}', file=sys.stderr)
+        return 1
+
+    feed_path = dest_dir.joinpath(urlsplit(args.feed_url).path.lstrip('/'))  # Saved for reference; it contains no token
+    feed_path.parent.mkdir(parents=True, exist_ok=True)
+    _atomic_write_json(feed_path, feed)
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+        futures = {executor.submit(mirror_release, release, dest_dir): release for release in releases}
+        for future in as_completed(futures):
+            release = futures[future]
+            try:
+                path, downloaded = future.result()
+            except Exception as e:  # noqa
+                print(f'Error mirroring {release["url"]}: {e}', file=sys.stderr)
+                failed += 1
+            else:
+                print(f'{"Downloaded" if downloaded else "Up to date"}: {path.as_posix()}')
+
+    return 1 if failed else 0
+
+
+def _releases_to_mirror(feed: Dict[str, Any], specs: List[List[str]]) -> List[Dict[str, Any]]:
+    releases = {}
+    for system, system_info in feed['computer'].items():
+        for spec in specs:
+            spec_system, build, distro = (spec + [None, None])[:3]
+            if spec_system.lower() != system.lower():
+                continue
+            for release in system_info['releases']:
+                if (not build or release['build'] == build) and (not distro or release['distro'] == distro):
+                    releases[release['url']] = release
+
+    return list(releases.values())
+
+
+def mirror_release(release: Dict[str, Any], dest_dir: Path) -> Tuple[Path, bool]:
+    """
+    Download the given release into the given mirror directory, if it is not already present.
+
+    :return: Tuple of (path, whether the file was downloaded)
+    """
+    path = dest_dir.joinpath(urlsplit(release['url']).path.lstrip('/'))
+    expected = release.get('checksum')
+    if path.exists() and (not expected or (_trusted_checksum(path) or _file_sha1(path)) == expected):
+        return path, False
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = path.with_name(f'{path.name}.part')
+    checksum = save_file(release['url'], save_path=part_path)
+    if expected and checksum != expected:
+        part_path.unlink()
+        raise PlexInstallError(f'checksum mismatch - expected={expected} found={checksum}')
+
+    part_path.replace(path)
+    _write_integrity_sidecar(path, checksum)
+    return path, True
+
+
+# endregion
 
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['mirror']:
+        sys.exit(mirror(sys.argv[2:]))
     main()
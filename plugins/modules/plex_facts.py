@@ -0,0 +1,94 @@
+"""
+Ansible module that reports the installed Plex Media Server version as facts.
+
+This only reads the installed version file (and the staged version marker) on each host, so it is cheap enough to run
+across every jail.  The latest version is resolved once and passed in, rather than being looked up on every host.
+
+:author: Doug Skrypa
+"""
+
+from pathlib import Path
+from typing import Optional
+
+from ansible.module_utils.basic import AnsibleModule
+
+INSTALL_PATH_DEFAULT = '/usr/local/share/plex_media_server'
+
+DOCUMENTATION = f"""
+---
+module: plex_facts
+short_description: Plex version facts
+description:
+    - Report the installed Plex version as the C(plex) fact, without any network access or filesystem writes
+options:
+    plex_install_path:
+        description:
+            - The directory in which Plex is installed
+        default: {INSTALL_PATH_DEFAULT}
+        type: str
+    latest_version:
+        description:
+            - The latest available version, resolved once for all hosts (e.g., via the C(plex) module with
+              I(state=resolved) and C(run_once)).  When provided, C(up_to_date) is also reported.
+        type: str
+        default: None
+author: dskrypa
+"""
+
+EXAMPLES = """
+- name: Resolve the latest Plex version once
+  plex:
+    x_plex_token: "{{ x_plex_token }}"
+    state: resolved
+  run_once: true
+  register: plex_resolved
+
+- name: Gather Plex version facts
+  plex_facts:
+    latest_version: "{{ plex_resolved.versions.latest }}"
+
+- debug: var=plex
+"""
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec={
+            'plex_install_path': {'default': INSTALL_PATH_DEFAULT, 'type': 'str'},
+            'latest_version': {'type': 'str', 'default': None},
+        },
+        supports_check_mode=True,
+    )
+
+    install_dir = Path(module.params['plex_install_path'])
+    latest = module.params['latest_version']
+    installed = _read_version(install_dir)
+    facts = {
+        'install_path': install_dir.as_posix(),
+        'installed_version': installed,
+        'staged_version': _staged_version(install_dir),
+        'latest_version': latest,
+        'up_to_date': installed == latest if latest else None,
+    }
+    module.exit_json(changed=False, ansible_facts={'plex': facts})
+
+
+def _read_version(version_dir: Path) -> Optional[str]:
+    try:
+        return version_dir.joinpath('__version__.txt').read_text('utf-8').strip()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _staged_version(install_dir: Path) -> Optional[str]:
+    """The version that was staged by the ``plex`` module with ``state=staged``, if any"""
+    versions_dir = install_dir.with_name(f'{install_dir.name}.versions')
+    try:
+        name = versions_dir.joinpath('.staged').read_text('utf-8').partition('\n')[0].strip()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return _read_version(versions_dir.joinpath(name)) if name else None
+
+
+if __name__ == '__main__':
+    main()